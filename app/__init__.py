@@ -1,33 +1,80 @@
+import sqlite3
+
 from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_moment import Moment
 from flask_mail import Mail
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from config import config
+from .cache import KeyedCache
+from .mail_queue import MailQueue
+from .metrics import Metrics
+from .passwords import PasswordHasher, LoginThrottle
+from .search import SearchIndex
+from .singleflight import SingleFlight
+from .startup import bytecode_cache
 
 moment = Moment()
 bootstrap = Bootstrap()
 db = SQLAlchemy()
 mail = Mail()
+mail_queue = MailQueue()
 login_manager = LoginManager()
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
+menu_cache = KeyedCache('menu')
+user_cache = KeyedCache('user', default_backend='null')
+fragment_cache = KeyedCache('fragment')
+encoded_cache = KeyedCache('encoded')
+search_index = SearchIndex()
+metrics = Metrics()
+single_flight = SingleFlight()
 login_manager.session_protection = 'strong'
 login_manager.login_view = 'auth.login'
 
 
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """ sqlite only enforces foreign keys, and so ON DELETE CASCADE, when
+    asked to on every connection
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 # factory function
 def create_app(config_name):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
+    # must be set before app.jinja_env is first used
+    app.jinja_options = dict(app.jinja_options,
+                             bytecode_cache=bytecode_cache(app))
 
     moment.init_app(app)
     bootstrap.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
     mail.init_app(app)
+    mail_queue.init_app(app)
+    menu_cache.init_app(app)
+    user_cache.init_app(app)
+    fragment_cache.init_app(app)
+    encoded_cache.init_app(app)
+    search_index.init_app(app)
+    metrics.init_app(app)
+    single_flight.init_app(app)
 
+    from .fragments import render_fragment
+    app.add_template_global(render_fragment, 'cached_fragment')
 
     # register blueprint
     from .main import main as main_blueprint
@@ -1,11 +1,13 @@
 from flask import render_template, redirect, url_for, request, flash, \
-    current_app
+    current_app, jsonify, g
 from flask_login import login_required, login_user, logout_user, current_user
 
 from app import db
 from app.auth.forms import LoginForm, RegistrationForm, UpdatePasswordForm, \
     ResetPasswordForm, PasswordResetRequestForm, ChangeEmailRequestForm
 from app.models import User
+from app.passwords import HashingBusy, LoginThrottled
+from app.tokens import basic_auth, token_auth, denylist
 from . import auth
 from ..email import send_email
 
@@ -41,8 +43,17 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         # Login and validate the user.
-        user = User.query.filter_by(email=form.email.data).first()
-        if user is not None and user.verify_password(form.password.data):
+        try:
+            user = User.authenticate(form.email.data, form.password.data,
+                                     request.remote_addr)
+        except LoginThrottled as e:
+            flash('Too many failed logins, try again in %d seconds.'
+                  % e.retry_after)
+            return render_template('auth/login.html', form=form), 429
+        except HashingBusy:
+            flash('The server is busy, please try again.')
+            return render_template('auth/login.html', form=form), 503
+        if user is not None:
             login_user(user, form.remember_me.data)
             return redirect(request.args.get('next') or
                             url_for('main.display_restaurants'))
@@ -58,13 +69,43 @@ def logout():
     return redirect(url_for('main.display_restaurants'))
 
 
+@auth.route('/tokens', methods=['POST'])
+@basic_auth.login_required
+def issue_token():
+    """ issue a bearer token for the JSON api, authenticated with email
+    and password as http basic auth, or with the session
+    :return: token and its lifetime in seconds in JSON format
+    """
+    expiration = min(request.args.get(
+        'expires_in', current_app.config['API_TOKEN_EXPIRATION'], type=int),
+        current_app.config['API_TOKEN_MAX_EXPIRATION'])
+    if expiration <= 0:
+        return jsonify(error='expires_in must be positive'), 400
+    return jsonify(token=g.token_user.generate_api_token(expiration),
+                   token_type='Bearer', expires_in=expiration)
+
+
+@auth.route('/tokens', methods=['DELETE'])
+@token_auth.login_required
+def revoke_token():
+    """ revoke the bearer token of the request
+    :return: 204 no content
+    """
+    denylist.add(g.api_user.jti, g.api_user.expires)
+    return '', 204
+
+
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # store user in database
-        user = User(username=form.username.data, email=form.email.data,
-                    password=form.password.data)
+        try:
+            user = User(username=form.username.data, email=form.email.data,
+                        password=form.password.data)
+        except HashingBusy:
+            flash('The server is busy, please try again.')
+            return render_template('auth/register.html', form=form), 503
         db.session.add(user)
         db.session.commit()
         token = user.generate_confirmation_token()
@@ -109,8 +150,15 @@ def resend_confirmation():
 def update_password():
     form = UpdatePasswordForm()
     if form.validate_on_submit():
-        if current_user.verify_password(form.old_password.data):
-            current_user.password = form.new_password.data
+        try:
+            verified = current_user.verify_password(form.old_password.data)
+            if verified:
+                current_user.password = form.new_password.data
+        except HashingBusy:
+            flash('The server is busy, please try again.')
+            return render_template('auth/update_password.html',
+                                   form=form), 503
+        if verified:
             db.session.add(current_user)
             print('before flash message')
             flash('Password has been updated.')
@@ -146,7 +194,12 @@ def password_reset(token):
         user = User.query.filter_by(email=form.email.data).first()
         if user is None:
             return redirect(url_for('main.display_restaurants'))
-        if user.reset_password(token, form.password.data):
+        try:
+            reset = user.reset_password(token, form.password.data)
+        except HashingBusy:
+            flash('The server is busy, please try again.')
+            return render_template('auth/reset_password.html', form=form), 503
+        if reset:
             db.session.add(user)
             flash('Password has been reset')
             return redirect(url_for('auth.login'))
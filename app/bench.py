@@ -0,0 +1,324 @@
+'''
+- http load benchmark of the main and auth blueprints
+- seeds a synthetic database, drives the flask test client (or a real wsgi
+  server) through representative scenarios
+- reports latency percentiles, throughput and sql statements per request,
+  and compares them with a baseline file
+'''
+
+import hashlib
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import db, password_hasher
+from .models import Role, User, MenuItem
+from .seed import bulk_load, synthesize
+
+PASSWORD = 'benchmark'
+
+# name, method, path(ids) -> url, form data, user ('user', 'admin' or None),
+# status of a successful request, any other status counts as an error
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'data', 'user',
+                                   'expected'], defaults=(200,))
+
+SCENARIOS = [
+    Scenario('restaurants', 'GET', lambda ids: '/restaurants/', None, 'user'),
+    Scenario('restaurants_page', 'GET',
+             lambda ids: '/restaurants/?after=%d' % ids.restaurant(), None,
+             'user'),
+    Scenario('restaurants_json', 'GET', lambda ids: '/restaurants/JSON',
+             None, None),
+    Scenario('menu', 'GET',
+             lambda ids: '/restaurant/%d/menu/' % ids.restaurant(), None,
+             None),
+    Scenario('menu_json', 'GET',
+             lambda ids: '/restaurant/%d/menu/JSON' % ids.restaurant(), None,
+             None),
+    Scenario('menu_item_json', 'GET',
+             lambda ids: '/restaurant/%d/menu/%d/JSON' % ids.item(), None,
+             None),
+    Scenario('search_json', 'GET', lambda ids: '/search/JSON?q=dish', None,
+             None),
+    Scenario('login', 'POST', lambda ids: '/auth/login',
+             lambda ids: {'email': ids.user_email(), 'password': PASSWORD},
+             None, 302),
+    Scenario('edit_menu_item', 'POST',
+             lambda ids: '/restaurant/%d/menu/%d/edit/' % ids.item(),
+             lambda ids: {'menu_item_name': 'Edited %d' % random.randint(
+                 1, 10 ** 6)},
+             'admin', 302),
+]
+
+
+class Ids:
+    """ random ids of the seeded rows """
+    def __init__(self, restaurants, items, users):
+        self.restaurants = restaurants
+        self.items = items
+        self.users = users
+
+    def restaurant(self):
+        return random.choice(self.restaurants)
+
+    def item(self):
+        return random.choice(self.items)
+
+    def user_email(self):
+        return random.choice(self.users)
+
+
+def seed(restaurants, items, users):
+    """ recreate the database with synthetic data
+    :return: Ids
+    """
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+    roles = {role.name: role.id for role in Role.query}
+    # hashing is deliberately slow, every user gets the same password
+    password_hash = password_hasher.hash(PASSWORD)
+    rows = []
+    for i in range(users + 1):
+        email = 'admin@example.com' if i == 0 else 'user%d@example.com' % i
+        rows.append({
+            'username': 'admin' if i == 0 else 'user%d' % i,
+            'email': email,
+            'password_hash': password_hash,
+            'confirmed': True,
+            'role_id': roles['Administrator' if i == 0 else 'User'],
+            'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest(),
+        })
+    db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+    bulk_load(synthesize(restaurants, items))
+    item_ids = [(row.restaurant_id, row.id) for row in
+                db.session.query(MenuItem.restaurant_id, MenuItem.id)
+                .limit(10000)]
+    return Ids([restaurant_id for restaurant_id, item_id in item_ids] or [1],
+               item_ids or [(1, 1)],
+               [row['email'] for row in rows[1:]] or [rows[0]['email']])
+
+
+class QueryCounter:
+    """ counts sql statements executed by any engine """
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(Engine, 'after_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def percentile(sorted_values, p):
+    """ nearest rank percentile of an already sorted list """
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, wall, queries, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'queries_per_request': round(queries / len(latencies), 2)
+        if queries is not None else None,
+    }
+
+
+def _login(client, email):
+    response = client.post('/auth/login',
+                           data={'email': email, 'password': PASSWORD})
+    # a failed login renders the form again with 200
+    if response.status_code != 302:
+        raise RuntimeError('login of %s failed with status %d'
+                           % (email, response.status_code))
+
+
+def run_test_client(app, ids, requests, scenarios=SCENARIOS):
+    """ drive the flask test client, one request at a time
+    :return: dict scenario name: summary
+    """
+    results = {}
+    for scenario in scenarios:
+        client = app.test_client()
+        if scenario.user:
+            _login(client, 'admin@example.com' if scenario.user == 'admin'
+                   else ids.user_email())
+        latencies, errors = [], 0
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            for i in range(requests):
+                url = scenario.path(ids)
+                data = scenario.data(ids) if scenario.data else None
+                began = time.perf_counter()
+                response = client.open(url, method=scenario.method,
+                                       data=data)
+                latencies.append(time.perf_counter() - began)
+                errors += response.status_code != scenario.expected
+            wall = time.perf_counter() - start
+        results[scenario.name] = summarize(latencies, wall, counter.count,
+                                           errors)
+    return results
+
+
+def run_server(app, ids, requests, concurrency, scenarios=SCENARIOS):
+    """ serve the app with werkzeug's threaded server and send requests with
+    concurrency client threads, sql statements are counted in process
+    :return: dict scenario name: summary
+    """
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    base = 'http://127.0.0.1:%d' % server.server_port
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    results = {}
+    try:
+        for scenario in scenarios:
+            results[scenario.name] = _run_server_scenario(
+                base, ids, scenario, requests, concurrency)
+    finally:
+        server.shutdown()
+    return results
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # a redirect is raised as HTTPError, its status is what is measured
+    def redirect_request(self, *args):
+        return None
+
+
+def _open(opener, url, data=None):
+    """ send a request without following redirects
+    :return: status code of the response
+    """
+    try:
+        response = opener.open(url, urllib.parse.urlencode(data)
+                               .encode('ascii') if data is not None else None)
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    response.read()
+    return response.status
+
+
+def _opener(base, user, ids):
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+        _NoRedirect())
+    if user:
+        email = 'admin@example.com' if user == 'admin' else ids.user_email()
+        status = _open(opener, base + '/auth/login',
+                       {'email': email, 'password': PASSWORD})
+        # a failed login renders the form again with 200
+        if status != 302:
+            raise RuntimeError('login of %s failed with status %d'
+                               % (email, status))
+    return opener
+
+
+def _run_server_scenario(base, ids, scenario, requests, concurrency):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        opener = _opener(base, scenario.user, ids)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            data = scenario.data(ids) if scenario.data else None
+            began = time.perf_counter()
+            status = _open(opener, base + scenario.path(ids), data)
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += status != scenario.expected
+
+    with QueryCounter() as counter:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker)
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+    # logins of the client threads are counted too, close enough
+    return summarize(latencies, wall, counter.count, errors[0])
+
+
+def compare(results, baseline, threshold=10.0):
+    """ percentage change of the latencies compared with a baseline run
+    :return: list of (scenario, metric, baseline, current, change %,
+    regression)
+    """
+    rows = []
+    for name, summary in sorted(results.items()):
+        before = baseline.get('results', baseline).get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            old, new = before.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            rows.append((name, metric, old, new, round(change, 1),
+                         change > threshold))
+    return rows
+
+
+def settings_mismatch(settings, baseline):
+    """ settings that differ from those the baseline was run with, results
+    of different data sizes or drivers are not comparable
+    :param settings: settings of this run
+    :param baseline: loaded baseline file
+    :return: list of (setting, baseline value, current value), the baseline
+    value is None for a file saved without settings
+    """
+    before = baseline.get('settings', {})
+    rows = []
+    for name, value in sorted(settings.items()):
+        if name == 'concurrency' and not settings.get('server') and \
+                not before.get('server'):
+            # client threads are only used with a server
+            continue
+        if before.get(name) != value:
+            rows.append((name, before.get(name), value))
+    return rows
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(path, settings, results):
+    with open(path, 'w') as f:
+        json.dump({'settings': settings, 'results': results}, f, indent=2,
+                  sort_keys=True)
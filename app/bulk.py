@@ -0,0 +1,148 @@
+'''
+- validate and write many menu items of a restaurant in one transaction
+- inserts and updates are sent as batched (executemany) statements
+'''
+
+from datetime import datetime
+
+from . import db
+from .models import Restaurant, MenuItem, User, MAX_ID, sqlite_sequence
+
+# field: maximum length
+FIELDS = {'name': 80, 'description': 250, 'price': 10, 'course': 250}
+
+
+def validate(row, allow_id):
+    """ check one menu item of a bulk request
+    :return: tuple (values, error), values is None when the row is invalid
+    """
+    if not isinstance(row, dict):
+        return None, 'menu item must be an object'
+    unknown = set(row) - set(FIELDS) - {'id'}
+    if unknown:
+        return None, 'unknown fields: %s' % ', '.join(sorted(unknown))
+    if 'id' in row and not allow_id:
+        return None, 'id is not allowed, use PUT to update menu items'
+    if 'id' in row and (not isinstance(row['id'], int) or
+                        isinstance(row['id'], bool)):
+        return None, 'id must be an integer'
+    if 'id' in row and not 0 < row['id'] <= MAX_ID:
+        return None, 'id is out of range'
+    if 'id' not in row and not row.get('name'):
+        return None, 'name is required'
+    values = {}
+    for field, length in FIELDS.items():
+        if field not in row:
+            continue
+        value = row[field]
+        if value is not None and not isinstance(value, str):
+            return None, '%s must be a string' % field
+        if value is not None and len(value) > length:
+            return None, '%s is longer than %d characters' % (field, length)
+        if field == 'name' and not value:
+            return None, 'name is required'
+        values[field] = value
+    if 'id' in row:
+        values['id'] = row['id']
+    return values, None
+
+
+def upsert_menu_items(restaurant_id, rows, allow_update=False, user_id=None):
+    """ insert menu items, and update the ones with an id when allow_update
+    invalid rows are reported and skipped, the valid rows are written in a
+    single transaction
+    :param restaurant_id: restaurant the menu items belong to
+    :param rows: list of menu item dicts
+    :param allow_update: rows with an id update that menu item
+    :param user_id: user whose activity counters are incremented
+    :return: list with a result dict per row, in the order of rows
+    """
+    results = [None] * len(rows)
+    inserts, updates = [], []
+    for index, row in enumerate(rows):
+        values, error = validate(row, allow_update)
+        if error:
+            results[index] = {'status': 'error', 'error': error}
+        elif 'id' in values:
+            updates.append((index, values))
+        else:
+            inserts.append((index, values))
+
+    if updates:
+        # only menu items of this restaurant can be updated
+        existing = {item_id for item_id, in db.session.query(MenuItem.id)
+                    .filter(MenuItem.restaurant_id == restaurant_id,
+                            MenuItem.id.in_([v['id'] for i, v in updates]))}
+        for index, values in updates:
+            if values['id'] not in existing:
+                results[index] = {'status': 'error', 'id': values['id'],
+                                  'error': 'menu item not found'}
+        updates = [(i, v) for i, v in updates if v['id'] in existing]
+
+    if not inserts and not updates:
+        return results
+
+    # on sqlite this takes the write lock, which keeps the ids assigned
+    # below free until commit
+    Restaurant.touch_menu(restaurant_id)
+    _update(updates)
+    _insert(restaurant_id, inserts)
+    User.count_activity(user_id, created=len(inserts), edited=len(updates))
+    db.session.commit()
+
+    for index, values in updates:
+        results[index] = {'status': 'updated', 'id': values['id']}
+    for index, values in inserts:
+        results[index] = {'status': 'created', 'id': values['id']}
+    return results
+
+
+def _update(updates):
+    table = MenuItem.__table__
+    now = datetime.utcnow()
+    # executemany needs the same columns in every row
+    batches = {}
+    for index, values in updates:
+        row = {'item_id': values['id']}
+        for field in FIELDS:
+            if field in values:
+                row[field] = values[field]
+        if 'course' in values or 'price' in values:
+            derived = MenuItem.row(dict(values))
+            if 'course' in values:
+                row['course_key'] = derived['course_key']
+            if 'price' in values:
+                row['price_cents'] = derived['price_cents']
+        batches.setdefault(tuple(sorted(row)), []).append(row)
+    for columns, rows in batches.items():
+        statement = table.update() \
+            .where(table.c.id == db.bindparam('item_id')) \
+            .values(version=table.c.version + 1, updated_at=now,
+                    **{column: db.bindparam(column)
+                       for column in columns if column != 'item_id'})
+        db.session.execute(statement, rows)
+
+
+def _insert(restaurant_id, inserts):
+    if not inserts:
+        return
+    if db.engine.dialect.name == 'sqlite':
+        next_id = max(db.session.query(db.func.max(MenuItem.id)).scalar()
+                      or 0, sqlite_sequence('menu_item')) + 1
+        rows = []
+        for index, values in inserts:
+            values['id'] = next_id
+            next_id += 1
+            rows.append(MenuItem.row(dict(
+                {field: None for field in FIELDS}, restaurant_id=restaurant_id,
+                **values)))
+        db.session.execute(MenuItem.__table__.insert(), rows)
+    else:
+        # let the database assign ids, the orm reads them back
+        items = [MenuItem(restaurant_id=restaurant_id, **values)
+                 for index, values in inserts]
+        db.session.add_all(items)
+        db.session.flush()
+        for (index, values), item in zip(inserts, items):
+            values['id'] = item.id
+
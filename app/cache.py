@@ -0,0 +1,233 @@
+'''
+- small cache backends with hit/miss/eviction counters
+- LRUCache lives in the worker process, SharedCache talks to a store that is
+  shared by all workers (redis, or LocalSharedClient as a stand-in)
+- KeyedCache is the read-through cache used for menus and users
+'''
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from fnmatch import fnmatch
+
+# returned by backends on a miss, None is a valid cached value
+MISSING = object()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class LRUCache:
+    """ in-process cache, evicts the least recently used key when maxsize is
+    reached and drops keys older than ttl seconds (ttl 0 never expires)
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalSharedClient:
+    """ stand-in for a redis client, implements the subset SharedCache uses
+    so the shared backend can run without a redis server
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.time() + ex if ex else 0, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def scan_iter(self, match='*'):
+        with self._lock:
+            keys = [key for key in self._data if fnmatch(key, match)]
+        return iter(keys)
+
+
+class SharedCache:
+    """ cache in a store shared by all workers, values are pickled
+    eviction is up to the store, so evictions are not counted here
+    """
+    def __init__(self, client, prefix='menu-app:', ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def get(self, key):
+        data = self.client.get(self.prefix + str(key))
+        if data is None:
+            self.stats.misses += 1
+            return MISSING
+        self.stats.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key),
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=self.ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class NullCache:
+    """ caching disabled, every lookup is a miss """
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.misses += 1
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+def make_cache(backend, maxsize=1024, ttl=300, url=None, prefix='menu-app:'):
+    """ create cache backend by name: 'lru', 'shared' or 'null'
+    the shared backend connects to url with redis when given, otherwise it
+    uses a LocalSharedClient
+    """
+    if backend == 'lru':
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if backend == 'shared':
+        if url:
+            import redis
+            client = redis.StrictRedis.from_url(url)
+        else:
+            client = LocalSharedClient()
+        return SharedCache(client, prefix=prefix, ttl=ttl)
+    if backend == 'null':
+        return NullCache()
+    raise ValueError('unknown cache backend: %r' % backend)
+
+
+class KeyedCache:
+    """ read-through cache configured by the <NAME>_CACHE_BACKEND, _SIZE,
+    _TTL and _URL settings, e.g. MENU_CACHE_BACKEND for KeyedCache('menu')
+    writers must call invalidate(key) after they commit
+    """
+    def __init__(self, name, default_backend='lru', app=None):
+        self.name = name
+        self.default_backend = default_backend
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        setting = self.name.upper() + '_CACHE_'
+        self.backend = make_cache(
+            app.config.get(setting + 'BACKEND', self.default_backend),
+            maxsize=app.config.get(setting + 'SIZE', 1024),
+            ttl=app.config.get(setting + 'TTL', 300),
+            url=app.config.get(setting + 'URL'),
+            prefix='menu-app:%s:' % self.name)
+        app.extensions[self.name + '_cache'] = self
+
+    def get(self, key, loader):
+        """ return cached value, call loader(key) on a miss
+        None is returned but not cached
+        """
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = loader(key)
+            if value is not None:
+                self.backend.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        stats = self.backend.stats.as_dict()
+        stats['backend'] = type(self.backend).__name__
+        if isinstance(self.backend, LRUCache):
+            stats['size'] = len(self.backend)
+            stats['maxsize'] = self.backend.maxsize
+        return stats
@@ -0,0 +1,45 @@
+import hashlib
+
+from flask import request, current_app
+
+
+def make_etag(*parts):
+    """ strong etag built from the values that identify a representation
+    e.g. ('menu', restaurant_id, menu_version)
+    """
+    data = '/'.join(str(part) for part in parts)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def is_not_modified(etag, last_modified=None):
+    """ evaluate If-None-Match and If-Modified-Since of the current request
+    If-Modified-Since is only used when the client sends no If-None-Match
+    :return: True if the client copy is still valid
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag) or \
+            request.if_none_match.star_tag
+    if last_modified is not None and request.if_modified_since is not None:
+        # http dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional(etag, last_modified, build):
+    """ answer a GET with 304 if the client copy is valid, otherwise build
+    the response
+    :param etag: strong etag of the current representation
+    :param last_modified: naive utc datetime or None
+    :param build: function returning the full response, only called when
+    the body is needed
+    :return: response with ETag and Last-Modified headers
+    """
+    if is_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
@@ -1,8 +1,9 @@
 from functools import wraps
-from flask import abort
+from flask import abort, g, request
 from flask_login import current_user
 
 from app.models import Permission
+from app.tokens import token_auth
 
 
 def permission_required(permission):
@@ -17,4 +18,31 @@ def permission_required(permission):
 
 
 def admin_required(f):
-    return permission_required(Permission.ADMINISTER)(f)
\ No newline at end of file
+    return permission_required(Permission.ADMINISTER)(f)
+
+
+def api_permission_required(permission):
+    """ permission_required for JSON endpoints, requests with a bearer token
+    are authorized by its claims instead of the session
+    """
+    def decorator(f):
+        session_view = permission_required(permission)(f)
+
+        @token_auth.login_required
+        def token_view(*args, **kwargs):
+            if not g.api_user.can(permission):
+                abort(403)
+            return f(*args, **kwargs)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            authorization = request.headers.get('Authorization', '')
+            if authorization.lower().startswith('bearer '):
+                return token_view(*args, **kwargs)
+            return session_view(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def api_admin_required(f):
+    return api_permission_required(Permission.ADMINISTER)(f)
@@ -1,6 +1,6 @@
 from flask import render_template, current_app
 from flask_mail import Message
-from . import mail
+from . import mail, mail_queue
 
 
 def send_email(to, subject, template, **kwargs):
@@ -9,4 +9,8 @@ def send_email(to, subject, template, **kwargs):
                   recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    mail.send(msg)
+    if current_app.config['MAIL_QUEUE_ENABLED']:
+        # delivered in the background, see app.mail_queue
+        mail_queue.enqueue(msg)
+    else:
+        mail.send(msg)
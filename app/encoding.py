@@ -0,0 +1,138 @@
+'''
+- content negotiation for the JSON api: compact JSON or MessagePack by the
+  Accept header, gzip, deflate or brotli by Accept-Encoding
+- bodies below COMPRESS_MIN_SIZE are sent uncompressed
+- encoded bodies are cached by etag and variant, so a representation is
+  serialized and compressed once
+- msgpack and brotli are used when their packages are installed
+'''
+
+import gzip
+import json
+import zlib
+
+from flask import current_app, request
+
+from . import encoded_cache, single_flight
+from .conditional import conditional, make_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+
+def mimetypes():
+    """ formats the server can produce, preferred first """
+    if msgpack is None:
+        return [JSON]
+    return [JSON, MSGPACK, 'application/x-msgpack']
+
+
+def codings():
+    """ content codings the server can produce, preferred first """
+    if brotli is None:
+        return ['gzip', 'deflate']
+    return ['br', 'gzip', 'deflate']
+
+
+def negotiate():
+    """ format and content coding of the response, from the Accept and
+    Accept-Encoding headers of the request
+    :return: tuple (mimetype, coding), coding None for no compression
+    """
+    mimetype = request.accept_mimetypes.best_match(mimetypes(), default=JSON)
+    if mimetype != JSON:
+        mimetype = MSGPACK
+    coding = request.accept_encodings.best_match(codings(), default=None)
+    return mimetype, coding
+
+
+def brotli_quality(level):
+    """ brotli quality for a zlib compression level, the scales differ:
+    zlib 1-9 against brotli 0-11, where qualities above 6 cost many times
+    the cpu for a few percent of size
+    :param level: zlib level, -1 for the zlib default
+    :return: brotli quality
+    """
+    if level < 0:
+        level = 6
+    return max(0, min(level - 1, 6))
+
+
+def compress(body, coding):
+    level = current_app.config['COMPRESS_LEVEL']
+    if coding == 'gzip':
+        return gzip.compress(body, level)
+    if coding == 'deflate':
+        return zlib.compress(body, level)
+    if coding == 'br':
+        return brotli.compress(body, quality=brotli_quality(level))
+    return body
+
+
+def encode(data, mimetype, coding):
+    """ serialize and compress data
+    :param data: JSON serializable data, or bytes that are already JSON
+    :return: tuple (coding used, body), compression is skipped for bodies
+    smaller than COMPRESS_MIN_SIZE
+    """
+    if mimetype == JSON:
+        body = data if isinstance(data, bytes) else json.dumps(
+            data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    else:
+        if isinstance(data, bytes):
+            data = json.loads(data.decode('utf-8'))
+        body = msgpack.packb(data, use_bin_type=True)
+    if coding is None or len(body) < current_app.config['COMPRESS_MIN_SIZE']:
+        return None, body
+    return coding, compress(body, coding)
+
+
+def encoded_response(etag, last_modified, build, stored=None, variant=None):
+    """ response with the data of build in the negotiated format and coding
+    :param etag: etag of the data, None for an uncached response without
+    validators
+    :param last_modified: naive utc datetime or None
+    :param build: function returning the data, or JSON bytes, only called
+    when the variant is not cached
+    :param stored: dict coding: JSON body that is already encoded, used as
+    is for JSON requests with that coding; an uncompressed body under
+    COMPRESS_MIN_SIZE is used for any coding
+    :param variant: result of negotiate(), when the caller already has it
+    :return: response, 304 when the client copy is still valid
+    """
+    mimetype, coding = variant or negotiate()
+
+    def respond(key=None):
+        if mimetype == JSON and stored and coding in stored:
+            used, body = coding, stored[coding]
+        elif mimetype == JSON and stored and None in stored and \
+                len(stored[None]) < current_app.config['COMPRESS_MIN_SIZE']:
+            used, body = None, stored[None]
+        elif key is None:
+            used, body = encode(build(), mimetype, coding)
+        else:
+            # concurrent requests for the same variant share one build
+            used, body = encoded_cache.get(key, lambda key: single_flight.do(
+                ('encoded', key), lambda: encode(build(), mimetype, coding)))
+        response = current_app.response_class(body, mimetype=mimetype)
+        if used:
+            response.headers['Content-Encoding'] = used
+        return response
+
+    if etag is None:
+        response = respond()
+    else:
+        key = make_etag(etag, mimetype, coding or '')
+        response = conditional(key, last_modified, lambda: respond(key))
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
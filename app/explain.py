@@ -0,0 +1,138 @@
+'''
+- run EXPLAIN QUERY PLAN for the queries issued by the views
+- flags full table scans and sorts in a temporary b-tree, so a missing
+  index shows up before it is slow
+'''
+
+from datetime import datetime
+
+from . import db
+from .export import _catalog_rows, _menu_rows
+from .fields import MENU_ITEM_FIELDS, menu_items_query
+from .menus import menu_query, menus_query, price_query
+from .models import Restaurant, MenuItem, MenuDocument, User, Role, \
+    OutboxMessage
+
+
+def view_queries():
+    """ representative queries of the views, with made up parameters
+    :return: list of (description, sqlalchemy statement)
+    """
+    session = db.session
+    menu_item = MenuItem.__table__
+    return [
+        ('display_restaurants, restaurants_json: keyset page',
+         session.query(Restaurant.id, Restaurant.version,
+                       Restaurant.menu_version)
+         .filter(Restaurant.id > 100).order_by(Restaurant.id).limit(51)),
+        ('restaurants_json: rows of a page',
+         session.query(Restaurant).filter(Restaurant.id.in_([1, 2, 3]))
+         .order_by(Restaurant.id)),
+        ('restaurant_menu_json: menu document',
+         session.query(MenuDocument.version, MenuDocument.updated_at,
+                       MenuDocument.json_body,
+                       db.func.length(MenuDocument.json_body))
+         .filter_by(restaurant_id=1)),
+        ('restaurant_menu_json with price range or fields: validators',
+         session.query(Restaurant.menu_version, Restaurant.menu_updated_at)
+         .filter_by(id=1)),
+        ('display_restaurant_menu: menu version',
+         session.query(Restaurant.menu_version).filter_by(id=1)),
+        ('display_restaurant_menu: menu',
+         menu_query(1)),
+        ('restaurant_menu_json: price range',
+         price_query(1, min_cents=500, max_cents=1000, sort_by_price=True)),
+        ('display_restaurant_menu: price range by course',
+         price_query(1, min_cents=500, sort_by_price=True, by_course=True)),
+        ('restaurant_menu_item_json: validators',
+         session.query(MenuItem.version, MenuItem.updated_at)
+         .filter_by(id=1)),
+        ('edit_menu_item, delete_menu_item: menu item',
+         session.query(MenuItem).filter_by(id=1, restaurant_id=1)),
+        ('restaurants_json ?include=menu_items: menu items of a page',
+         menu_items_query([1, 2, 3])),
+        ('menus_json: restaurants with their menu items',
+         menus_query([1, 2, 3], MENU_ITEM_FIELDS)),
+        ('restaurant_menu_ndjson, restaurant_menu_csv: menu export',
+         _menu_rows(1)),
+        ('export: catalogue',
+         _catalog_rows()),
+        ('bulk_menu_items: existing menu items',
+         session.query(MenuItem.id).filter(MenuItem.restaurant_id == 1,
+                                           MenuItem.id.in_([1, 2, 3]))),
+        ('delete_restaurant: menu items of the restaurant',
+         menu_item.delete().where(menu_item.c.restaurant_id == 1)),
+        ('search: hydrate results',
+         session.query(MenuItem, Restaurant.name)
+         .join(Restaurant, MenuItem.restaurant_id == Restaurant.id)
+         .filter(MenuItem.id.in_([1, 2, 3]))),
+        ('login, register, password_reset: user by email',
+         session.query(User).filter_by(email='someone@example.com')),
+        ('register, user: user by username',
+         session.query(User).filter_by(username='someone')),
+        ('user: profile with role',
+         User.profile_query().filter_by(username='someone')),
+        ('users: page of users with role',
+         User.profile_query().filter(User.id > 100).order_by(User.id)
+         .limit(51)),
+        ('user_loader: user with role',
+         session.query(User).outerjoin(Role, User.role_id == Role.id)
+         .filter(User.id == 1)),
+        ('mail queue: due messages',
+         session.query(OutboxMessage.id).filter(
+             OutboxMessage.status == OutboxMessage.PENDING,
+             OutboxMessage.next_attempt_at <= datetime.utcnow())
+         .order_by(OutboxMessage.next_attempt_at).limit(20)),
+    ]
+
+
+def _statement(query):
+    return getattr(query, 'statement', query)
+
+
+def explain(statement):
+    """ query plan of a statement, sqlite only
+    :return: list of plan detail strings
+    """
+    compiled = _statement(statement).compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup] \
+        if compiled.positiontup else []
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+        # rows are (id, parent, notused, detail)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def is_full_scan(detail):
+    """ 'SCAN menu_item' reads every row, 'SCAN menu_item USING INDEX ...'
+    and 'SEARCH ...' do not
+    """
+    return detail.startswith('SCAN') and 'INDEX' not in detail
+
+
+def is_temp_sort(detail):
+    """ 'USE TEMP B-TREE FOR ORDER BY' sorts every matching row, no index
+    has the order of the query
+    """
+    return 'USE TEMP B-TREE' in detail
+
+
+def audit():
+    """ explain every view query
+    :return: list of (description, plan details, has full scan, sorts in
+    a temporary b-tree)
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('explain supports sqlite only, not %s'
+                           % db.engine.dialect.name)
+    report = []
+    for description, statement in view_queries():
+        details = explain(statement)
+        report.append((description, details,
+                       any(is_full_scan(detail) for detail in details),
+                       any(is_temp_sort(detail) for detail in details)))
+    return report
@@ -0,0 +1,80 @@
+'''
+- stream menus and the whole catalogue as NDJSON or CSV without holding
+  them in memory
+'''
+
+import csv
+import io
+import json
+
+from . import db
+from .models import MenuItem, Restaurant
+
+MENU_ITEM_FIELDS = ('id', 'name', 'description', 'price', 'course')
+
+# rows fetched from the database at a time
+CHUNK_SIZE = 500
+
+
+def _menu_rows(restaurant_id):
+    columns = [getattr(MenuItem, field) for field in MENU_ITEM_FIELDS]
+    return db.session.query(*columns) \
+        .filter(MenuItem.restaurant_id == restaurant_id) \
+        .order_by(MenuItem.id).yield_per(CHUNK_SIZE)
+
+
+def _catalog_rows():
+    columns = [getattr(MenuItem, field) for field in MENU_ITEM_FIELDS]
+    return db.session.query(Restaurant.id, Restaurant.name, *columns) \
+        .outerjoin(MenuItem, MenuItem.restaurant_id == Restaurant.id) \
+        .order_by(Restaurant.id, MenuItem.id) \
+        .execution_options(stream_results=True).yield_per(CHUNK_SIZE)
+
+
+def menu_ndjson(restaurant_id):
+    """ menu items of a restaurant, one JSON object per line
+    :return: generator of lines
+    """
+    for row in _menu_rows(restaurant_id):
+        yield json.dumps(dict(zip(MENU_ITEM_FIELDS, row)),
+                         separators=(',', ':')) + '\n'
+
+
+def menu_csv(restaurant_id):
+    """ menu items of a restaurant as CSV with a header line
+    :return: generator of lines
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    yield line(MENU_ITEM_FIELDS)
+    for row in _menu_rows(restaurant_id):
+        yield line(row)
+
+
+def catalog_ndjson():
+    """ every restaurant with its menu items, one restaurant per line, in id
+    order
+    restaurants and menu items are read with one joined query through a
+    server side cursor, so only one restaurant is held in memory
+    :return: generator of lines
+    """
+    restaurant = None
+    for row in _catalog_rows():
+        if restaurant is None or restaurant['id'] != row[0]:
+            if restaurant is not None:
+                yield json.dumps(restaurant, separators=(',', ':')) + '\n'
+            restaurant = {'id': row[0], 'name': row[1], 'menu_items': []}
+        if row[2] is not None:
+            # outer join, restaurants without menu items have no item columns
+            restaurant['menu_items'].append(dict(zip(MENU_ITEM_FIELDS,
+                                                     row[2:])))
+    if restaurant is not None:
+        yield json.dumps(restaurant, separators=(',', ':')) + '\n'
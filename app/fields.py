@@ -0,0 +1,90 @@
+'''
+- sparse fieldsets for the JSON api: ?fields=name,price selects only those
+  columns, the id is always included
+- ?include=menu_items adds the menu items of every restaurant on a page,
+  loaded with one IN query, ?fields[menu_items]= projects them
+'''
+
+from flask import request, abort
+
+from . import db
+from .menus import sort_by_course
+from .models import Restaurant, MenuItem, MenuDocument
+
+RESTAURANT_FIELDS = ('id', 'name')
+MENU_ITEM_FIELDS = MenuDocument.FIELDS
+INCLUDES = ('menu_items',)
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def fields_arg(allowed, arg='fields'):
+    """ read a comma separated list of fields from the query string
+    :param allowed: all fields of the resource, in output order
+    :param arg: name of the query string argument
+    :return: tuple of fields in the order of allowed, None when the argument
+    is absent; aborts with 400 on an unknown field
+    """
+    value = request.args.get(arg)
+    if value is None:
+        return None
+    fields = _names(value)
+    if not fields <= set(allowed):
+        abort(400)
+    fields.add('id')
+    return tuple(field for field in allowed if field in fields)
+
+
+def include_arg(allowed=INCLUDES):
+    """ read ?include= from the query string
+    :return: sorted tuple of related resources, aborts with 400 on an
+    unknown one
+    """
+    includes = _names(request.args.get('include', ''))
+    if not includes <= set(allowed):
+        abort(400)
+    return tuple(sorted(includes))
+
+
+def columns(model, fields):
+    return [getattr(model, field) for field in fields]
+
+
+def restaurant_rows(restaurant_ids, fields=RESTAURANT_FIELDS):
+    """ restaurants as dicts of fields, without loading entities
+    :return: list of dicts ordered by id
+    """
+    if not restaurant_ids:
+        return []
+    rows = db.session.query(*columns(Restaurant, fields)) \
+        .filter(Restaurant.id.in_(restaurant_ids)).order_by(Restaurant.id)
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def menu_items_by_restaurant(restaurant_ids, fields=MENU_ITEM_FIELDS):
+    """ menu items of several restaurants with a single query
+    :return: dict restaurant id: list of menu item dicts, in the course
+    order of the menu document, then by id
+    """
+    menus = {restaurant_id: [] for restaurant_id in restaurant_ids}
+    if not restaurant_ids:
+        return menus
+    course_keys = {restaurant_id: [] for restaurant_id in restaurant_ids}
+    for row in menu_items_query(restaurant_ids, fields):
+        menus[row[0]].append(dict(zip(fields, row[2:])))
+        course_keys[row[0]].append(row[1])
+    return {restaurant_id: sort_by_course(items, course_keys[restaurant_id])
+            for restaurant_id, items in menus.items()}
+
+
+def menu_items_query(restaurant_ids, fields=MENU_ITEM_FIELDS):
+    """ menu items of several restaurants with one IN query
+    :return: query of rows (restaurant id, course key, *fields) ordered by
+    restaurant, course key and id
+    """
+    return db.session.query(MenuItem.restaurant_id, MenuItem.course_key,
+                            *columns(MenuItem, fields)) \
+        .filter(MenuItem.restaurant_id.in_(restaurant_ids)) \
+        .order_by(MenuItem.restaurant_id, MenuItem.course_key, MenuItem.id)
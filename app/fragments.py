@@ -0,0 +1,50 @@
+'''
+- cache of the rendered html of one restaurant or menu item in a list
+- the markup only depends on the entity and whether the viewer is an
+  administrator, so hot pages mostly join cached strings
+- keyed by id and version, writes do not invalidate anything
+'''
+
+from flask import get_template_attribute
+from flask_login import current_user
+
+from . import fragment_cache
+from .cache import MISSING
+
+# kind: macro in macros.html
+MACROS = {
+    'restaurant': 'build_restaurant',
+    'menu_item': 'build_item',
+}
+
+
+def _field(entity, name):
+    # menus are cached as dicts, other lists hold model objects
+    if isinstance(entity, dict):
+        return entity[name]
+    return getattr(entity, name)
+
+
+def render_fragment(kind, entity, restaurant_id=None):
+    """ html of the macro of kind for entity, rendered once per version
+    available in templates as cached_fragment
+    the key holds the id and the version, which are never reused, so a
+    write needs no invalidation and every worker drops old versions by
+    eviction or ttl
+    :param kind: 'restaurant' or 'menu_item'
+    :param entity: model object or dict with id and version
+    :param restaurant_id: restaurant of a menu item
+    :return: Markup
+    """
+    admin = bool(current_user.is_administrator)
+    key = (kind, _field(entity, 'id'), _field(entity, 'version'), admin)
+    html = fragment_cache.backend.get(key)
+    if html is not MISSING:
+        return html
+    macro = get_template_attribute('macros.html', MACROS[kind])
+    if kind == 'menu_item':
+        html = macro(entity, restaurant_id, current_user)
+    else:
+        html = macro(entity, current_user)
+    fragment_cache.backend.set(key, html)
+    return html
@@ -0,0 +1,186 @@
+'''
+- outgoing email is stored in the outbox table and delivered by a fixed
+  pool of worker threads, so requests don't wait for the smtp server
+- the outbox row is written by the transaction of the request, workers
+  are woken when it commits
+- messages survive restarts, workers pick up whatever is still pending
+- failed deliveries are retried with exponential backoff
+- a worker sends a batch of messages over a single smtp connection
+'''
+
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_QUEUE_ENABLED', True)
+        app.config.setdefault('MAIL_QUEUE_WORKERS', 2)
+        app.config.setdefault('MAIL_QUEUE_BATCH_SIZE', 20)
+        app.config.setdefault('MAIL_QUEUE_MAX_ATTEMPTS', 5)
+        app.config.setdefault('MAIL_QUEUE_RETRY_DELAY', 30)
+        app.config.setdefault('MAIL_QUEUE_POLL_INTERVAL', 10)
+        # a message still 'sending' after this long belongs to a dead worker
+        app.config.setdefault('MAIL_QUEUE_CLAIM_TIMEOUT', 600)
+        self.app = app
+        app.extensions['mail_queue'] = self
+
+        if app.config['MAIL_QUEUE_ENABLED']:
+            # deliver messages left over from a previous run
+            app.before_first_request(self.start)
+
+    def enqueue(self, msg):
+        """ add message to the outbox in the current session, a worker is
+        woken when the session commits, e.g. at the end of the request
+        """
+        from . import db
+        from .models import OutboxMessage
+        session = db.session()
+        session.add(OutboxMessage(
+            subject=msg.subject, sender=msg.sender,
+            recipients=json.dumps(list(msg.recipients)),
+            body=msg.body, html=msg.html))
+        session.info['mail_queue'] = self
+
+    def wakeup(self):
+        """ start the workers if needed and let one look for due messages
+        """
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """ start the worker threads, safe to call more than once
+        """
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.app.config['MAIL_QUEUE_WORKERS']):
+                worker = threading.Thread(target=self._run,
+                                          name='mail-queue-%d' % i)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self):
+        """ stop the worker threads once their current batch is done
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._stopping.set()
+            self._wakeup.set()
+        for worker in workers:
+            worker.join()
+        self._stopping.clear()
+
+    def _run(self):
+        interval = self.app.config['MAIL_QUEUE_POLL_INTERVAL']
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    while self.process_batch():
+                        pass
+            except Exception:
+                logger.exception('mail queue worker failed')
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+
+    def process_batch(self):
+        """ claim due messages and deliver them over one smtp connection
+        must run inside an application context
+        :return: number of messages claimed
+        """
+        from . import db, mail
+        from .models import OutboxMessage
+
+        config = self.app.config
+        now = datetime.utcnow()
+        outbox = db.session.query(OutboxMessage)
+
+        # release messages of workers that died while sending
+        outbox.filter(
+            OutboxMessage.status == OutboxMessage.SENDING,
+            OutboxMessage.claimed_at < now - timedelta(
+                seconds=config['MAIL_QUEUE_CLAIM_TIMEOUT'])
+        ).update({OutboxMessage.status: OutboxMessage.PENDING},
+                 synchronize_session=False)
+
+        # the conditional update makes the claim safe between workers
+        # and processes
+        claim = uuid.uuid4().hex
+        due = [row.id for row in db.session.query(OutboxMessage.id).filter(
+            OutboxMessage.status == OutboxMessage.PENDING,
+            OutboxMessage.next_attempt_at <= now,
+        ).order_by(OutboxMessage.next_attempt_at)
+            .limit(config['MAIL_QUEUE_BATCH_SIZE'])]
+        if due:
+            outbox.filter(OutboxMessage.id.in_(due),
+                          OutboxMessage.status == OutboxMessage.PENDING) \
+                .update({OutboxMessage.status: OutboxMessage.SENDING,
+                         OutboxMessage.claim: claim,
+                         OutboxMessage.claimed_at: now},
+                        synchronize_session=False)
+        db.session.commit()
+        messages = outbox.filter_by(claim=claim).all() if due else []
+        if not messages:
+            return 0
+
+        try:
+            with mail.connect() as connection:
+                for message in messages:
+                    try:
+                        connection.send(Message(
+                            message.subject, sender=message.sender,
+                            recipients=message.recipient_list,
+                            body=message.body, html=message.html))
+                    except Exception as e:
+                        self._retry(message, e)
+                    else:
+                        message.status = OutboxMessage.SENT
+                        message.sent_at = datetime.utcnow()
+        except Exception as e:
+            # could not connect, or the connection broke
+            for message in messages:
+                if message.status == OutboxMessage.SENDING:
+                    self._retry(message, e)
+        db.session.commit()
+        return len(messages)
+
+    def _retry(self, message, error):
+        from .models import OutboxMessage
+        config = self.app.config
+        message.attempts += 1
+        message.last_error = str(error)
+        if message.attempts >= config['MAIL_QUEUE_MAX_ATTEMPTS']:
+            message.status = OutboxMessage.FAILED
+            logger.error('giving up on outbox message %s: %s',
+                         message.id, error)
+        else:
+            message.status = OutboxMessage.PENDING
+            message.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=config['MAIL_QUEUE_RETRY_DELAY'] *
+                2 ** (message.attempts - 1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_mail_queue(session):
+    queue = session.info.pop('mail_queue', None)
+    if queue is not None:
+        queue.wakeup()
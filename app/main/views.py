@@ -1,12 +1,24 @@
+import re
+
 from flask import render_template, request, redirect, url_for, jsonify, flash, \
-    abort
+    abort, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 
 from . import main
 from .forms import EditProfileForm, EditProfileAdminForm
-from app.decorators import admin_required
-from .. import db
-from ..models import Restaurant, MenuItem, User, Role
+from app.bulk import upsert_menu_items
+from app.conditional import conditional, make_etag
+from app.encoding import JSON, encoded_response, negotiate
+from app.decorators import admin_required, api_admin_required
+from app.export import menu_ndjson, menu_csv, catalog_ndjson
+from app.fields import RESTAURANT_FIELDS, MENU_ITEM_FIELDS, columns, \
+    fields_arg, include_arg, menu_items_by_restaurant, restaurant_rows
+from app.menus import get_menu, get_filtered_menu, price_query, load_menus
+from app.pagination import keyset_paginate, page_args
+from app.tokens import current_api_user
+from .. import db, menu_cache, fragment_cache, search_index, single_flight
+from ..models import Restaurant, MenuItem, MenuDocument, User, Role, \
+    MAX_ID, parse_price
 
 
 @main.route('/')
@@ -14,11 +26,14 @@ from ..models import Restaurant, MenuItem, User, Role
 @login_required
 def display_restaurants():
     """
-    Display a list of all restaurants
+    Display a page of restaurants, ordered by id
     :return: restaurants page
     """
-    restaurants = db.session.query(Restaurant).all()
-    return render_template('restaurants.html', restaurants=restaurants)
+    after, before, per_page = page_args()
+    page = keyset_paginate(db.session.query(Restaurant), Restaurant.id,
+                           after=after, before=before, per_page=per_page)
+    return render_template('restaurants.html', restaurants=page.items,
+                           page=page)
 
 
 @main.route('/restaurant/new/', methods=['GET', 'POST'])
@@ -32,6 +47,9 @@ def create_restaurant():
         # request.form stores form data!
         restaurant = Restaurant(name=request.form['restaurant_name'])
         db.session.add(restaurant)
+        db.session.flush()
+        # its empty menu document is written in the same transaction
+        MenuDocument.mark_stale(db.session(), restaurant.id)
         db.session.commit()
         flash('New Restaurant Created')
         return redirect(url_for('main.display_restaurants'))
@@ -48,8 +66,10 @@ def edit_restaurant(restaurant_id):
     """
     if request.method == 'POST':
         # update syntax is weird!
-        db.session.query(Restaurant).filter_by(id=restaurant_id).update({Restaurant.name: request.form['edit']})
+        db.session.query(Restaurant).filter_by(id=restaurant_id).update(
+            Restaurant.changes({Restaurant.name: request.form['edit']}))
         db.session.commit()
+        search_index.index_restaurant(restaurant_id)
         flash('Restaurant Succesfully Edited')
         return redirect(url_for('main.display_restaurants'))
     else:
@@ -65,8 +85,16 @@ def delete_restaurant(restaurant_id):
     :return: delete restaurant page
     """
     if request.method == 'POST':
+        # the foreign key cascades too, this also covers databases created
+        # before it did
+        db.session.query(MenuItem).filter_by(restaurant_id=restaurant_id) \
+            .delete(synchronize_session=False)
+        db.session.query(MenuDocument) \
+            .filter_by(restaurant_id=restaurant_id).delete()
         db.session.query(Restaurant).filter_by(id=restaurant_id).delete()
         db.session.commit()
+        menu_cache.invalidate(restaurant_id)
+        search_index.remove_restaurant(restaurant_id)
         flash('Restaurant Successfully Deleted')
         return redirect(url_for('main.display_restaurants'))
     else:
@@ -74,16 +102,43 @@ def delete_restaurant(restaurant_id):
         return render_template('delete_restaurant.html', restaurant=restaurant)
 
 
+def _price_args():
+    """ read min_price, max_price and sort from the query string
+    :return: tuple (min_cents, max_cents, sort_by_price), aborts with 400 on
+    a price that is not a number
+    """
+    prices = []
+    for arg in ('min_price', 'max_price'):
+        value = request.args.get(arg)
+        cents = parse_price(value)
+        if value and cents is None:
+            abort(400)
+        prices.append(cents)
+    return prices[0], prices[1], request.args.get('sort') == 'price'
+
+
 @main.route('/restaurant/<int:restaurant_id>/')
 @main.route('/restaurant/<int:restaurant_id>/menu/')
 def display_restaurant_menu(restaurant_id):
     """
-    Display a restaurant menu with menu items sorted by course
+    Display a restaurant menu with menu items sorted by course, optionally
+    within ?min_price= and ?max_price= and sorted with ?sort=price
     :param restaurant_id:  restaurant id
     :return: restaurant menu page
     """
-    menu_items = db.session.query(MenuItem).filter_by(restaurant_id=restaurant_id).all()
-    return render_template('menu.html', menu_items=menu_items, restaurant_id=restaurant_id)
+    min_cents, max_cents, sort_by_price = _price_args()
+    if min_cents is None and max_cents is None and not sort_by_price:
+        courses = get_menu(restaurant_id)['courses']
+    else:
+        courses = get_filtered_menu(restaurant_id, min_cents, max_cents,
+                                    sort_by_price)
+    return render_template('menu.html', courses=courses, restaurant_id=restaurant_id)
+
+
+def _count_activity(created=0, edited=0):
+    # anonymous writes are not counted
+    if current_user.is_authenticated:
+        User.count_activity(current_user.id, created=created, edited=edited)
 
 
 @main.route('/restaurant/<int:restaurant_id>/menu/new/', methods=['GET', 'POST'])
@@ -93,6 +148,10 @@ def create_menu_item(restaurant_id):
     :param restaurant_id: restaurant id
     :return: create restaurant page
     """
+    # the foreign key would reject the item with an IntegrityError
+    if db.session.query(Restaurant.id).filter_by(id=restaurant_id).first() \
+            is None:
+        abort(404)
     if request.method == 'POST':
         menu_item = MenuItem(name=request.form['menu_item_name'],
                              course=request.form['menu_item_course'],
@@ -100,7 +159,11 @@ def create_menu_item(restaurant_id):
                              description=request.form['menu_item_description'],
                              restaurant_id=restaurant_id,)
         db.session.add(menu_item)
+        Restaurant.touch_menu(restaurant_id)
+        _count_activity(created=1)
         db.session.commit()
+        menu_cache.invalidate(restaurant_id)
+        search_index.index_item(menu_item.id)
         flash('Menu Item Created')
         return redirect(url_for('main.display_restaurant_menu', restaurant_id=restaurant_id))
     else:
@@ -116,12 +179,24 @@ def edit_menu_item(restaurant_id, menu_item_id):
     :return: edit menu item page
     """
     if request.method == 'POST':
-        db.session.query(MenuItem).filter_by(id=menu_item_id).update({MenuItem.name: request.form['menu_item_name']})
+        # the item must belong to the restaurant whose menu is touched
+        updated = db.session.query(MenuItem).filter_by(
+            id=menu_item_id, restaurant_id=restaurant_id).update(
+            MenuItem.changes({MenuItem.name: request.form['menu_item_name']}))
+        if not updated:
+            abort(404)
+        Restaurant.touch_menu(restaurant_id)
+        _count_activity(edited=1)
         db.session.commit()
+        menu_cache.invalidate(restaurant_id)
+        search_index.index_item(menu_item_id)
         flash('Menu Item Successfully Edited')
         return redirect(url_for('main.display_restaurant_menu', restaurant_id=restaurant_id))
     else:
-        menu_item = db.session.query(MenuItem).filter_by(id=menu_item_id).first()
+        menu_item = db.session.query(MenuItem).filter_by(
+            id=menu_item_id, restaurant_id=restaurant_id).first()
+        if menu_item is None:
+            abort(404)
         return render_template('edit_menu_item.html', restaurant_id=restaurant_id, menu_item=menu_item)
 
 
@@ -134,34 +209,343 @@ def delete_menu_item(restaurant_id, menu_item_id):
     :return: delete menu item page
     """
     if request.method == 'POST':
-        db.session.query(MenuItem).filter_by(id=menu_item_id).delete()
+        deleted = db.session.query(MenuItem).filter_by(
+            id=menu_item_id, restaurant_id=restaurant_id).delete()
+        if not deleted:
+            abort(404)
+        Restaurant.touch_menu(restaurant_id)
         db.session.commit()
+        menu_cache.invalidate(restaurant_id)
+        search_index.remove_item(menu_item_id)
         flash('Menu Item Successfully Deleted')
         return redirect(url_for('main.display_restaurant_menu', restaurant_id=restaurant_id))
     else:
-        menu_item = db.session.query(MenuItem).filter_by(id=menu_item_id).first()
+        menu_item = db.session.query(MenuItem).filter_by(
+            id=menu_item_id, restaurant_id=restaurant_id).first()
+        if menu_item is None:
+            abort(404)
         return render_template('delete_menu_item.html', restaurant_id=restaurant_id, menu_item=menu_item)
 
 
 @main.route('/restaurants/JSON')
 def restaurants_json():
     """
-    jsonify restaurants
+    jsonify a page of restaurants, use the next and prev cursors as
+    ?after=<next> or ?before=<prev> to fetch the neighbouring pages
     :return: restaurants in JSON format
     """
-    restaurants = db.session.query(Restaurant).all()
-    return jsonify(restaurants=[restaurant.serialize for restaurant in restaurants])
+    after, before, per_page = page_args()
+    fields = fields_arg(RESTAURANT_FIELDS) or RESTAURANT_FIELDS
+    item_fields = fields_arg(MENU_ITEM_FIELDS, 'fields[menu_items]') or \
+        MENU_ITEM_FIELDS
+    includes = include_arg()
+    with_menus = 'menu_items' in includes
+    # paginate on the validator columns only, rows are loaded on a change
+    page = single_flight.do(
+        ('restaurants_page', after, before, per_page),
+        lambda: keyset_paginate(
+            db.session.query(Restaurant.id, Restaurant.version,
+                             Restaurant.menu_version),
+            Restaurant.id, after=after, before=before, per_page=per_page))
+    etag = make_etag('restaurants', fields, includes,
+                     item_fields if with_menus else None,
+                     page.next_cursor, page.prev_cursor,
+                     *((row.id, row.version,
+                        row.menu_version if with_menus else None)
+                       for row in page.items))
+
+    def build():
+        restaurants = restaurant_rows([row.id for row in page.items], fields)
+        if with_menus:
+            menus = menu_items_by_restaurant(
+                [restaurant['id'] for restaurant in restaurants], item_fields)
+            for restaurant in restaurants:
+                restaurant['menu_items'] = menus[restaurant['id']]
+        return {'restaurants': restaurants, 'next': page.next_cursor,
+                'prev': page.prev_cursor}
+    # no Last-Modified, deleting a row of the page does not change the
+    # updated_at of the others
+    return encoded_response(etag, None, build)
 
 
 @main.route('/restaurant/<int:restaurant_id>/menu/JSON')
 def restaurant_menu_json(restaurant_id):
     """
-    jsonify restaurant menu
+    jsonify restaurant menu, optionally within ?min_price= and ?max_price=,
+    sorted with ?sort=price and limited to ?fields=
     :param restaurant_id: restaurant id
     :return: restaurant menu in JSON format
     """
-    menu_items = db.session.query(MenuItem).filter_by(restaurant_id=restaurant_id).all()
-    return jsonify(menu_items=[menu_item.serialize for menu_item in menu_items])
+    min_cents, max_cents, sort_by_price = _price_args()
+    fields = fields_arg(MENU_ITEM_FIELDS)
+    if min_cents is None and max_cents is None and not sort_by_price and \
+            fields is None:
+        return _menu_document(restaurant_id)
+    fields = fields or MENU_ITEM_FIELDS
+    validators = single_flight.do(
+        ('menu_validators', restaurant_id),
+        db.session.query(Restaurant.menu_version, Restaurant.menu_updated_at)
+        .filter_by(id=restaurant_id).first)
+    if validators is None:
+        return jsonify(menu_items=[])
+
+    def build():
+        rows = price_query(restaurant_id, min_cents, max_cents,
+                           sort_by_price, columns=columns(MenuItem, fields))
+        return {'menu_items': [dict(zip(fields, row)) for row in rows]}
+    return encoded_response(
+        make_etag('menu', restaurant_id, validators.menu_version,
+                  min_cents, max_cents, sort_by_price, fields),
+        validators.menu_updated_at, build)
+
+
+# ascii digits only, str.isdigit() also accepts digits that int() rejects
+BATCH_ID = re.compile(r'\s*[0-9]+\s*$')
+
+
+def _batch_ids():
+    """ read restaurant ids from ?ids=1,2,3, or from the ids of a posted
+    JSON object or form
+    :return: list of unparsed ids, strings or JSON values, aborts with 400
+    when there is no list of ids
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        ids = data.get('ids') if isinstance(data, dict) else \
+            request.form.get('ids')
+    else:
+        ids = request.args.get('ids')
+    if isinstance(ids, str):
+        return [value for value in ids.split(',') if value.strip()]
+    if not isinstance(ids, list):
+        abort(400)
+    return ids
+
+
+def _parse_batch_ids(values):
+    """ convert ids read by _batch_ids to integers
+    :return: list of unique ids in request order, aborts with 400 on an id
+    that is not an integer, including JSON booleans and floats, and on one
+    outside the 64 bit id range
+    """
+    ids = []
+    for value in values:
+        if isinstance(value, str) and BATCH_ID.match(value):
+            value = int(value)
+        elif type(value) is not int:
+            abort(400)
+        if not 0 <= value <= MAX_ID:
+            abort(400)
+        ids.append(value)
+    return list(dict.fromkeys(ids))
+
+
+@main.route('/menus/JSON', methods=['GET', 'POST'])
+def menus_json():
+    """
+    jsonify the menus of several restaurants, ?ids=1,2,3 or a POST with
+    ids, optionally limited to ?fields=
+    :return: menus keyed by restaurant id and the ids that were not found,
+    in JSON format
+    """
+    values = _batch_ids()
+    if not values:
+        return jsonify(error='expected restaurant ids'), 400
+    # checked before parsing, duplicates count against the limit
+    if len(values) > current_app.config['MENUS_BATCH_MAX']:
+        return jsonify(error='at most %d restaurants per request'
+                       % current_app.config['MENUS_BATCH_MAX']), 413
+    restaurant_ids = _parse_batch_ids(values)
+    fields = fields_arg(MENU_ITEM_FIELDS) or MENU_ITEM_FIELDS
+    menus = load_menus(restaurant_ids, fields)
+    return encoded_response(None, None, lambda: {
+        'menus': {str(restaurant_id): menus[restaurant_id]
+                  for restaurant_id in restaurant_ids
+                  if restaurant_id in menus},
+        'missing': [restaurant_id for restaurant_id in restaurant_ids
+                    if restaurant_id not in menus],
+    })
+
+
+def _menu_document(restaurant_id):
+    """ stored JSON menu of a restaurant, read with one primary key lookup
+    the stored JSON and gzip bodies are sent as they are, the gzip body only
+    from COMPRESS_MIN_SIZE bytes of JSON; other variants are encoded from
+    the JSON body
+    """
+    variant = negotiate()
+    gzipped = variant == (JSON, 'gzip')
+    min_size = current_app.config['COMPRESS_MIN_SIZE']
+    size = db.func.length(MenuDocument.json_body)
+    body = db.case([(size >= min_size, MenuDocument.gzip_body)],
+                   else_=MenuDocument.json_body) \
+        if gzipped else MenuDocument.json_body
+    query = db.session.query(MenuDocument.version, MenuDocument.updated_at,
+                             body, size) \
+        .filter_by(restaurant_id=restaurant_id)
+    document = single_flight.do(('menu_document', restaurant_id, gzipped),
+                                query.first)
+    if document is not None:
+        version, updated_at, body, size = document
+    else:
+        # restaurants created before documents existed are encoded per
+        # request, without writing on a GET, until manage.py backfill
+        documents = MenuDocument.build([restaurant_id])
+        if not documents:
+            return jsonify(menu_items=[])
+        document = documents[0]
+        version, updated_at = document['version'], document['updated_at']
+        size = len(document['json_body'])
+        body = document['gzip_body' if gzipped and size >= min_size
+                        else 'json_body']
+    coding = 'gzip' if gzipped and size >= min_size else None
+    return encoded_response(
+        make_etag('menu', restaurant_id, version, None, None, False, None),
+        updated_at, lambda: body, stored={coding: body}, variant=variant)
+
+
+@main.route('/restaurant/<int:restaurant_id>/menu/bulk', methods=['POST', 'PUT'])
+@api_admin_required
+def bulk_menu_items(restaurant_id):
+    """
+    Write many menu items in one transaction. The body is a JSON list of
+    menu items, or {"menu_items": [...]}. POST creates menu items, PUT also
+    updates the menu items that have an id.
+    :param restaurant_id: restaurant id
+    :return: result per menu item in JSON format
+    """
+    if db.session.query(Restaurant.id).filter_by(id=restaurant_id).first() \
+            is None:
+        abort(404)
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('menu_items')
+    if not isinstance(data, list):
+        return jsonify(error='expected a list of menu items'), 400
+    if len(data) > current_app.config['BULK_MAX_ITEMS']:
+        return jsonify(error='at most %d menu items per request'
+                       % current_app.config['BULK_MAX_ITEMS']), 413
+
+    results = upsert_menu_items(restaurant_id, data,
+                                allow_update=request.method == 'PUT',
+                                user_id=current_api_user().id)
+    counts = {'created': 0, 'updated': 0, 'error': 0}
+    for result in results:
+        counts[result['status']] += 1
+    if counts['created'] or counts['updated']:
+        menu_cache.invalidate(restaurant_id)
+        search_index.index_restaurant(restaurant_id)
+    if not counts['error']:
+        status = 200
+    elif counts['created'] or counts['updated']:
+        status = 207
+    else:
+        status = 400
+    return jsonify(results=results, created=counts['created'],
+                   updated=counts['updated'], errors=counts['error']), status
+
+
+@main.route('/restaurant/<int:restaurant_id>/menu/export.ndjson')
+def export_menu_ndjson(restaurant_id):
+    """
+    stream restaurant menu, one JSON object per line
+    :param restaurant_id: restaurant id
+    :return: menu items in NDJSON format
+    """
+    return Response(stream_with_context(menu_ndjson(restaurant_id)),
+                    mimetype='application/x-ndjson')
+
+
+@main.route('/restaurant/<int:restaurant_id>/menu/export.csv')
+def export_menu_csv(restaurant_id):
+    """
+    stream restaurant menu as CSV
+    :param restaurant_id: restaurant id
+    :return: menu items in CSV format
+    """
+    return Response(stream_with_context(menu_csv(restaurant_id)),
+                    mimetype='text/csv', headers={
+                        'Content-Disposition':
+                            'attachment; filename=menu-%d.csv' % restaurant_id})
+
+
+@main.route('/catalog/export.ndjson')
+def export_catalog_ndjson():
+    """
+    stream all restaurants with their menus, one restaurant per line
+    :return: restaurants in NDJSON format
+    """
+    return Response(stream_with_context(catalog_ndjson()),
+                    mimetype='application/x-ndjson')
+
+
+def _search():
+    """ run the search in the query string: q, page and per_page
+    :return: tuple (query, page, per_page, total, results), each result is
+    a serialized menu item with restaurant id, restaurant name and score;
+    aborts with 400 for a page beyond SEARCH_MAX_OFFSET
+    """
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get(
+        'per_page', current_app.config['SEARCH_PER_PAGE'], type=int), 1),
+        current_app.config['MAX_PER_PAGE'])
+    # the offset must also fit a sqlite integer
+    if (page - 1) * per_page > current_app.config['SEARCH_MAX_OFFSET']:
+        abort(400)
+    total, hits = search_index.search(query, page, per_page)
+    rows = {}
+    if hits:
+        rows = {item.id: (item, restaurant_name) for item, restaurant_name
+                in db.session.query(MenuItem, Restaurant.name)
+                .join(Restaurant, MenuItem.restaurant_id == Restaurant.id)
+                .filter(MenuItem.id.in_([hit.item_id for hit in hits]))}
+    results = []
+    for hit in hits:
+        if hit.item_id not in rows:
+            # deleted since it was indexed
+            continue
+        item, restaurant_name = rows[hit.item_id]
+        result = item.serialize
+        result.update(restaurant_id=item.restaurant_id,
+                      restaurant_name=restaurant_name, score=hit.score)
+        results.append(result)
+    return query, page, per_page, total, results
+
+
+@main.route('/search')
+def search():
+    """
+    Search menu items by name, description, course and restaurant name
+    :return: search page
+    """
+    query, page, per_page, total, results = _search()
+    return render_template('search.html', query=query, page=page,
+                           per_page=per_page, total=total, results=results)
+
+
+@main.route('/search/JSON')
+def search_json():
+    """
+    jsonify search results, every word of q must match the start of a word
+    :return: matching menu items in JSON format, best matches first
+    """
+    query, page, per_page, total, results = _search()
+    return jsonify(query=query, page=page, per_page=per_page, total=total,
+                   results=results)
+
+
+@main.route('/cache/JSON')
+@api_admin_required
+def cache_stats_json():
+    """
+    jsonify cache counters, used to size the caches, and the coalesced
+    reads in flight
+    :return: hits, misses, evictions and waiters per key in JSON format
+    """
+    return jsonify(menu_cache=menu_cache.stats(),
+                   fragment_cache=fragment_cache.stats(),
+                   single_flight=single_flight.stats())
 
 
 @main.route('/restaurant/<int:restaurant_id>/menu/<int:menu_item_id>/JSON')
@@ -172,21 +556,45 @@ def restaurant_menu_item_json(restaurant_id, menu_item_id):
     :param menu_item_id: menu item id
     :return: menu item in JSON format
     """
-    menu_item = db.session.query(MenuItem).filter_by(id=menu_item_id).first()
-    if menu_item:
-        return jsonify(menu_item=menu_item.serialize)
+    validators = db.session.query(MenuItem.version, MenuItem.updated_at) \
+        .filter_by(id=menu_item_id).first()
+    if validators:
+        return conditional(
+            make_etag('menu_item', menu_item_id, validators.version),
+            validators.updated_at,
+            lambda: jsonify(menu_item=db.session.query(MenuItem).get(
+                menu_item_id).serialize))
     else:
         return "Menu item does not exist. JSON not available"
 
 
 @main.route('/user/<username>')
 def user(username):
-    user = User.query.filter_by(username=username).first()
+    """
+    Profile page, the user and its role are loaded with one query
+    :param username: username of the user
+    :return: user profile page
+    """
+    user = User.profile_query().filter_by(username=username).first()
     if user is None:
         abort(404)
     return render_template('user.html', user=user)
 
 
+@main.route('/users/')
+@login_required
+@admin_required
+def users():
+    """
+    Display a page of users with their role and activity, ordered by id
+    :return: users page
+    """
+    after, before, per_page = page_args('USERS_PER_PAGE')
+    page = keyset_paginate(User.profile_query(), User.id,
+                           after=after, before=before, per_page=per_page)
+    return render_template('users.html', users=page.items, page=page)
+
+
 @main.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
@@ -0,0 +1,171 @@
+from collections import namedtuple
+from itertools import groupby
+
+from . import db, menu_cache, single_flight
+from .cache import MISSING
+from .models import Restaurant, MenuItem, course_order
+
+# headings of the courses every menu is expected to have
+COURSE_LABELS = {
+    'appetizer': 'Appetizers',
+    'entree': 'Entrees',
+    'main': 'Main',
+    'dessert': 'Desserts',
+    'beverage': 'Beverages',
+}
+
+Course = namedtuple('Course', ['key', 'label', 'items'])
+
+
+def menu_query(restaurant_id):
+    """ menu items of a restaurant, ordered by course and id
+    """
+    return db.session.query(MenuItem) \
+        .filter_by(restaurant_id=restaurant_id) \
+        .order_by(MenuItem.course_key, MenuItem.id)
+
+
+def price_query(restaurant_id, min_cents=None, max_cents=None,
+                sort_by_price=False, by_course=False, columns=None):
+    """ menu items of a restaurant within a price range, filtered and
+    sorted in sql on the indexed price_cents column
+    :param min_cents: lowest price, inclusive
+    :param max_cents: highest price, inclusive
+    :param sort_by_price: cheapest first instead of by id
+    :param by_course: order by course first, for group_by_course
+    :param columns: select these MenuItem columns instead of entities
+    """
+    query = db.session.query(*(columns or [MenuItem])) \
+        .filter(MenuItem.restaurant_id == restaurant_id)
+    if min_cents is not None:
+        query = query.filter(MenuItem.price_cents >= min_cents)
+    if max_cents is not None:
+        query = query.filter(MenuItem.price_cents <= max_cents)
+    order = [MenuItem.course_key] if by_course else []
+    if sort_by_price:
+        order.append(MenuItem.price_cents)
+    order.append(MenuItem.id)
+    return query.order_by(*order)
+
+
+def group_by_course(items, key=lambda item: item.course_key):
+    """ group menu items that are already ordered by course key
+    :param items: menu items ordered by course key
+    :param key: function returning the course key of an item
+    :return: list of Course, the standard courses first, then the others
+    alphabetically
+    """
+    courses = []
+    for course_key, group in groupby(items, key=key):
+        group = list(group)
+        label = COURSE_LABELS.get(course_key) or \
+            (group[0].course or '').strip() or 'Other'
+        courses.append(Course(course_key, label, group))
+    # items arrive sorted on key, only the standard courses need moving up
+    courses.sort(key=lambda course: course_order(course.key))
+    return courses
+
+
+def load_menu(restaurant_id, version=None):
+    """ build the cacheable menu of a restaurant, holds only plain data so
+    it can be shared between requests and pickled by a shared cache
+    the JSON menu is served from MenuDocument instead
+    :param version: menu_version of the restaurant read before the items
+    :return: dict with the menu version and the serialized menu items
+    grouped by course, with their version for the fragment cache
+    """
+    return {'version': version, 'courses': serialize_courses(
+        group_by_course(menu_query(restaurant_id)))}
+
+
+def serialize_courses(courses):
+    """ courses of menu items as courses of plain dicts
+    """
+    return [Course(course.key, course.label,
+                   [dict(item.serialize, version=item.version)
+                    for item in course.items])
+            for course in courses]
+
+
+def get_menu(restaurant_id):
+    """ menu of a restaurant, read through the menu cache
+    a cached menu is only used while its version is the menu_version of the
+    restaurant, so an lru cache of one worker never serves a menu that
+    another worker changed
+    concurrent misses for the same restaurant share one load
+    """
+    version = single_flight.do(
+        ('menu_version', restaurant_id),
+        db.session.query(Restaurant.menu_version)
+        .filter_by(id=restaurant_id).scalar)
+    menu = menu_cache.backend.get(restaurant_id)
+    if menu is MISSING or menu['version'] != version:
+        menu = single_flight.do(('menu', restaurant_id, version),
+                                lambda: load_menu(restaurant_id, version))
+        menu_cache.backend.set(restaurant_id, menu)
+    return menu
+
+
+def get_filtered_menu(restaurant_id, min_cents=None, max_cents=None,
+                      sort_by_price=False):
+    """ courses of the menu items within a price range, concurrent
+    requests for the same range share one query
+    :return: list of Course with menu item dicts
+    """
+    return single_flight.do(
+        ('filtered_menu', restaurant_id, min_cents, max_cents, sort_by_price),
+        lambda: serialize_courses(group_by_course(price_query(
+            restaurant_id, min_cents, max_cents, sort_by_price,
+            by_course=True))))
+
+
+def load_menus(restaurant_ids, fields):
+    """ menus of several restaurants with one outer joined query, grouped
+    in python
+    :param restaurant_ids: ids of the restaurants
+    :param fields: MenuItem columns of the menu items
+    :return: dict restaurant id: dict with id, name and menu_items, for the
+    restaurants that exist; items in the course order of the menu document
+    """
+    if not restaurant_ids:
+        return {}
+    menus, course_keys = {}, {}
+    for row in menus_query(restaurant_ids, fields):
+        menu = menus.get(row[0])
+        if menu is None:
+            menu = menus[row[0]] = {'id': row[0], 'name': row[1],
+                                    'menu_items': []}
+            course_keys[row[0]] = []
+        # outer join, restaurants without menu items have no item columns
+        if row[2] is not None:
+            menu['menu_items'].append(dict(zip(fields, row[4:])))
+            course_keys[row[0]].append(row[3])
+    for restaurant_id, menu in menus.items():
+        menu['menu_items'] = sort_by_course(menu['menu_items'],
+                                            course_keys[restaurant_id])
+    return menus
+
+
+def menus_query(restaurant_ids, fields):
+    """ restaurants outer joined with their menu items, ordered by
+    restaurant, course key and id
+    :return: query of rows (restaurant id, restaurant name, menu item id,
+    course key, *fields)
+    """
+    return db.session.query(Restaurant.id, Restaurant.name, MenuItem.id,
+                            MenuItem.course_key,
+                            *[getattr(MenuItem, field) for field in fields]) \
+        .outerjoin(MenuItem, MenuItem.restaurant_id == Restaurant.id) \
+        .filter(Restaurant.id.in_(restaurant_ids)) \
+        .order_by(Restaurant.id, MenuItem.course_key, MenuItem.id)
+
+
+def sort_by_course(items, course_keys):
+    """ reorder items that are sorted by course key and id into menu order,
+    the standard courses first
+    :param course_keys: course key of each item
+    :return: list of items
+    """
+    order = sorted(range(len(items)),
+                   key=lambda index: course_order(course_keys[index]))
+    return [items[index] for index in order]
@@ -0,0 +1,191 @@
+'''
+- opt-in request and sql instrumentation, enabled with METRICS_ENABLED
+- per endpoint latency and query count histograms, sql and template render
+  timings, recent slow queries
+- exposed at /metrics in prometheus text format, slow queries at
+  /metrics/slow_queries to administrators only
+- cProfile output of a sample of requests, see METRICS_PROFILE_RATE
+'''
+
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from flask import g, request, current_app, has_request_context, \
+    request_started, request_tearing_down, template_rendered, \
+    before_render_template, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """ cumulative histogram per label value, as prometheus expects """
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # one counter per bucket plus +Inf, then sum
+                series = self._series[label_value] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_value, counts in series:
+            label = '%s="%s"' % (self.label, _escape(label_value))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d'
+                             % (self.name, label, bound, cumulative))
+            lines.append('%s_sum{%s} %f' % (self.name, label, counts[-1]))
+            lines.append('%s_count{%s} %d' % (self.name, label, cumulative))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.requests = Histogram(
+            'menu_request_duration_seconds', 'Request latency per endpoint',
+            'endpoint', LATENCY_BUCKETS)
+        self.queries = Histogram(
+            'menu_request_queries', 'SQL statements per request',
+            'endpoint', QUERY_COUNT_BUCKETS)
+        self.query_time = Histogram(
+            'menu_request_sql_seconds', 'Time spent in SQL per request',
+            'endpoint', LATENCY_BUCKETS)
+        self.templates = Histogram(
+            'menu_template_render_seconds', 'Template render time',
+            'template', LATENCY_BUCKETS)
+        self.slow_queries = deque(maxlen=50)
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', False)
+        app.config.setdefault('METRICS_SLOW_QUERY_MS', 100)
+        app.config.setdefault('METRICS_PROFILE_RATE', 0.0)
+        app.config.setdefault('METRICS_PROFILE_DIR',
+                              os.path.join(os.getcwd(), 'tmp', 'profiles'))
+        app.extensions['metrics'] = self
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        request_started.connect(self._request_started, app)
+        # teardown also runs for requests whose view raised
+        request_tearing_down.connect(self._request_tearing_down, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.add_url_rule('/metrics', 'metrics', self.prometheus)
+        # statements can hold literal values, like /cache/JSON it is admin only
+        from .decorators import api_admin_required
+        app.add_url_rule('/metrics/slow_queries', 'slow_queries',
+                         api_admin_required(self.slow_queries_json))
+
+    def _active(self):
+        return has_request_context() and \
+            current_app.extensions.get('metrics') is self and \
+            '_metrics_start' in g
+
+    def _request_started(self, app, **extra):
+        g._metrics_start = time.time()
+        g._metrics_queries = 0
+        g._metrics_sql_time = 0.0
+        g._metrics_profiler = None
+        if random.random() < app.config['METRICS_PROFILE_RATE']:
+            g._metrics_profiler = cProfile.Profile()
+            g._metrics_profiler.enable()
+
+    def _request_tearing_down(self, app, exc=None, **extra):
+        if '_metrics_start' not in g:
+            return
+        endpoint = request.endpoint or 'unknown'
+        elapsed = time.time() - g.pop('_metrics_start')
+        self.requests.observe(endpoint, elapsed)
+        self.queries.observe(endpoint, g._metrics_queries)
+        self.query_time.observe(endpoint, g._metrics_sql_time)
+        profiler = g._metrics_profiler
+        if profiler is not None:
+            profiler.disable()
+            directory = app.config['METRICS_PROFILE_DIR']
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            profiler.dump_stats(os.path.join(directory, '%s-%d.prof' % (
+                endpoint, int(time.time() * 1000))))
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        # kept on the execution, a statement that fails leaves nothing behind
+        if context is not None:
+            context._metrics_start = time.time()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.time() - start
+        if not self._active():
+            return
+        g._metrics_queries += 1
+        g._metrics_sql_time += elapsed
+        if elapsed * 1000 >= current_app.config['METRICS_SLOW_QUERY_MS']:
+            self.slow_queries.append({
+                'endpoint': request.endpoint,
+                'statement': statement,
+                'seconds': round(elapsed, 6),
+                'time': time.time(),
+            })
+
+    def _before_render(self, app, template, context, **extra):
+        if '_metrics_start' in g:
+            if '_metrics_templates' not in g:
+                g._metrics_templates = []
+            g._metrics_templates.append(time.time())
+
+    def _template_rendered(self, app, template, context, **extra):
+        starts = g.get('_metrics_templates')
+        if starts:
+            self.templates.observe(template.name or 'string',
+                                   time.time() - starts.pop())
+
+    def prometheus(self):
+        lines = []
+        for histogram in (self.requests, self.queries, self.query_time,
+                          self.templates):
+            lines.extend(histogram.render())
+        return current_app.response_class(
+            '\n'.join(lines) + '\n',
+            mimetype='text/plain; version=0.0.4')
+
+    def slow_queries_json(self):
+        return jsonify(slow_queries=list(self.slow_queries))
@@ -1,12 +1,83 @@
+import gzip
 import hashlib
+import json
+import uuid
 from datetime import datetime
+from decimal import Decimal, DecimalException
 
 from flask import current_app, request
 from flask_login import UserMixin, AnonymousUserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import validates, joinedload, Session
 
-from . import login_manager, db
+from . import login_manager, db, user_cache, password_hasher, login_throttle
+from .passwords import HashingBusy
+
+# keeps api tokens and confirmation tokens from being used for each other
+API_TOKEN_SALT = 'api-token'
+
+
+# courses in the order they are listed on a menu
+COURSES = ('appetizer', 'entree', 'main', 'dessert', 'beverage')
+
+
+def normalize_course(course):
+    """ key used to group and order menu items by course
+    :return: stripped, lower case course name
+    """
+    return (course or '').strip().lower()
+
+
+def course_order(course_key):
+    """ sort key of a course: the standard courses in menu order, then the
+    others alphabetically
+    """
+    try:
+        return COURSES.index(course_key), ''
+    except ValueError:
+        return len(COURSES), course_key or ''
+
+
+# largest value of a 64 bit integer column, sqlite raises OverflowError
+# for larger parameters
+MAX_ID = 2 ** 63 - 1
+
+def sqlite_sequence(table):
+    """ largest id an sqlite AUTOINCREMENT table ever handed out, loaders
+    that assign ids themselves must start above it and above max(id)
+    :return: id, 0 for a table created without AUTOINCREMENT
+    """
+    if not db.session.execute("SELECT 1 FROM sqlite_master "
+                              "WHERE name = 'sqlite_sequence'").first():
+        return 0
+    return db.session.execute(
+        'SELECT seq FROM sqlite_sequence WHERE name = :name',
+        {'name': table}).scalar() or 0
+
+
+# largest price in cents that fits a 32 bit integer column
+MAX_PRICE_CENTS = 2 ** 31 - 1
+MAX_PRICE = Decimal(MAX_PRICE_CENTS) / 100
+
+
+def parse_price(price):
+    """ convert a price such as '$7.50', '$.99' or '15' to cents
+    :return: price in cents, None if price is empty, not a finite number or
+    too large for an integer column
+    """
+    price = (price or '').replace('$', '').replace(',', '').strip()
+    if not price:
+        return None
+    try:
+        value = Decimal(price)
+        if not value.is_finite() or abs(value) > MAX_PRICE:
+            return None
+        cents = int((value * 100).to_integral_value())
+    except DecimalException:
+        # not a number, or an exponent beyond the decimal context
+        return None
+    return cents if abs(cents) <= MAX_PRICE_CENTS else None
 
 
 class Permission:
@@ -18,7 +89,7 @@ class User(db.Model, UserMixin):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
-    email = db.Column(db.String(255))
+    email = db.Column(db.String(255), index=True)
     password_hash = db.Column(db.String(128))
     confirmed = db.Column(db.Boolean, default=False)
     avatar_hash = db.Column(db.String(32))
@@ -28,6 +99,12 @@ class User(db.Model, UserMixin):
     name = db.Column(db.String(64))
     location = db.Column(db.String(64))
     about_me = db.Column(db.Text())
+    # activity counters, incremented by the writes themselves so profile
+    # pages never count menu items
+    items_created = db.Column(db.Integer, nullable=False, default=0,
+                              server_default='0')
+    items_edited = db.Column(db.Integer, nullable=False, default=0,
+                             server_default='0')
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -47,14 +124,90 @@ class User(db.Model, UserMixin):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """ check password, a hash made with other settings than
+        PASSWORD_HASH_METHOD and _ITERATIONS is replaced by a new one
+        """
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            try:
+                self.password = password
+            except HashingBusy:
+                # upgrade the hash at a later login
+                return True
+            db.session.add(self)
+        return True
+
+    @staticmethod
+    def authenticate(email, password, address=None):
+        """ user with this email and password
+        failed attempts are limited per account and per client address,
+        blocked attempts cost no password hashing
+        :param address: ip address of the client
+        :return: user, None when the credentials are wrong
+        :raise LoginThrottled: too many failed attempts
+        """
+        keys = login_throttle.keys(email, address)
+        login_throttle.check(keys)
+        user = User.query.options(joinedload(User.role)) \
+            .filter_by(email=email).first()
+        if user is not None and user.verify_password(password):
+            login_throttle.succeeded(keys)
+            return user
+        login_throttle.failed(keys)
+        return None
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        """ load the logged in user together with its role, flask-login
+        keeps the result for the rest of the request
+        with USER_CACHE_BACKEND set, the detached user is shared between
+        requests and merged into the session without a query
+        """
+        user = user_cache.get(int(user_id), User._load_detached)
+        if user is None:
+            return None
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def _load_detached(user_id):
+        user = User.query.options(joinedload(User.role)).get(user_id)
+        if user is None:
+            return None
+        # the cached copy must not belong to the session of this request
+        db.session.expunge(user)
+        if user.role is not None:
+            db.session.expunge(user.role)
+        return user
+
+    @staticmethod
+    def profile_query():
+        """ users with their role, loaded in the same query
+        """
+        return User.query.options(joinedload(User.role))
+
+    @staticmethod
+    def count_activity(user_id, created=0, edited=0):
+        """ add to the activity counters of a user, in the transaction of
+        the write that is counted
+        :param user_id: id of the user, None for anonymous writes
+        :param created: number of menu items created
+        :param edited: number of menu items edited
+        """
+        values = {}
+        if created:
+            values[User.items_created] = User.items_created + created
+        if edited:
+            values[User.items_edited] = User.items_edited + edited
+        if user_id is None or not values:
+            return
+        db.session.query(User).filter_by(id=user_id).update(
+            values, synchronize_session=False)
+        # bulk updates skip the mapper events
+        _mark_user_stale(db.session(), user_id)
 
     def generate_confirmation_token(self, expiration=3600):
         """ for safety purposes we send a confirmation token to the user
@@ -63,6 +216,20 @@ class User(db.Model, UserMixin):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
         return s.dumps({'confirm': self.id})
 
+    def generate_api_token(self, expiration=3600):
+        """ signed bearer token for the JSON api, the permissions are part
+        of the claims so requests are authorized without a query
+        :param expiration: seconds the token is valid
+        :return: token
+        """
+        s = Serializer(current_app.config['SECRET_KEY'], expiration,
+                       salt=API_TOKEN_SALT)
+        return s.dumps({
+            'id': self.id,
+            'perm': self.role.permissions if self.role is not None else 0,
+            'jti': uuid.uuid4().hex,
+        }).decode('ascii')
+
     def confirm(self, token):
         """ login procedure requires user to confirm the registration by
         email
@@ -112,7 +279,6 @@ class User(db.Model, UserMixin):
         """ system can verify whether user is administrator
         :return: returns true if user has administrator permissions
         """
-        print('self.can(Permission.ADMINISTER):', self.can(Permission.ADMINISTER))
         return self.can(Permission.ADMINISTER)
 
 
@@ -123,6 +289,7 @@ class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
         return False
 
+    @property
     def is_administrator(self):
         return False
 
@@ -160,12 +327,73 @@ class Role(db.Model):
         db.session.commit()
 
 
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    _mark_user_stale(Session.object_session(user), user.id)
+
+
+def _mark_user_stale(session, user_id):
+    # invalidate after commit, so no request can cache the old row again
+    info = session.info
+    if info.get('stale_users') != 'all':
+        info.setdefault('stale_users', set()).add(user_id)
+
+
+@event.listens_for(Role, 'after_update')
+def _role_changed(mapper, connection, role):
+    Session.object_session(role).info['stale_users'] = 'all'
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    stale = session.info.pop('stale_users', None)
+    if stale == 'all':
+        user_cache.clear()
+    elif stale:
+        for user_id in stale:
+            user_cache.invalidate(user_id)
+
+
 class Restaurant(db.Model):
     # table
     __tablename__ = 'restaurant'
     # mapper
     name = db.Column(db.String(80), nullable=False)
     id = db.Column(db.Integer, primary_key=True)
+    # bumped on every write of the restaurant row, see changes()
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    # bumped whenever a menu item of the restaurant is written or deleted,
+    # so the menu can be validated without reading its items
+    menu_version = db.Column(db.Integer, nullable=False, default=1,
+                             server_default='1')
+    menu_updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    # versions restart at 1, so etags and cached fragments are only unique
+    # while sqlite does not hand out the id of a deleted last row again
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    @staticmethod
+    def changes(values):
+        """ add version bump to values of an update of restaurant rows
+        :param values: dict of column: new value
+        :return: values extended with version and updated_at
+        """
+        values[Restaurant.version] = Restaurant.version + 1
+        values[Restaurant.updated_at] = datetime.utcnow()
+        return values
+
+    @staticmethod
+    def touch_menu(restaurant_id):
+        """ record that the menu of a restaurant has changed
+        """
+        db.session.query(Restaurant).filter_by(id=restaurant_id).update({
+            Restaurant.menu_version: Restaurant.menu_version + 1,
+            Restaurant.menu_updated_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        MenuDocument.mark_stale(db.session(), restaurant_id)
 
     @property
     def serialize(self):
@@ -184,8 +412,61 @@ class MenuItem(db.Model):
     course = db.Column(db.String(250))
     description = db.Column(db.String(250))
     price = db.Column(db.String(10))
-    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'))
+    # restaurant_id is the first column of the composite indexes below,
+    # they serve lookups by restaurant_id and the cascading delete
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id',
+                                                        ondelete='CASCADE'))
     restaurant = db.relationship(Restaurant)
+    # normalized copy of course, kept in sync by _set_course_key
+    course_key = db.Column(db.String(250))
+    # bumped on every write of the menu item row, see changes()
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    # price in cents, kept in sync by _set_price_cents
+    price_cents = db.Column(db.Integer)
+
+    # a menu is read as: restaurant_id = ? ORDER BY course_key, id
+    # price ranges as: restaurant_id = ? AND price_cents BETWEEN ? AND ?
+    # ids are never reused, like restaurant ids
+    __table_args__ = (
+        db.Index('ix_menu_item_restaurant_course',
+                 'restaurant_id', 'course_key', 'id'),
+        db.Index('ix_menu_item_restaurant_price',
+                 'restaurant_id', 'price_cents'),
+        {'sqlite_autoincrement': True},
+    )
+
+    @validates('course')
+    def _set_course_key(self, key, course):
+        self.course_key = normalize_course(course)
+        return course
+
+    @validates('price')
+    def _set_price_cents(self, key, price):
+        self.price_cents = parse_price(price)
+        return price
+
+    @staticmethod
+    def changes(values):
+        """ add version bump to values of an update of menu item rows
+        :param values: dict of column: new value
+        :return: values extended with version and updated_at
+        """
+        values[MenuItem.version] = MenuItem.version + 1
+        values[MenuItem.updated_at] = datetime.utcnow()
+        return values
+
+    @staticmethod
+    def row(values):
+        """ complete the values of a menu item inserted with a core insert
+        statement, which bypasses the validators that fill derived columns
+        :param values: dict of column name: value
+        :return: values
+        """
+        values['course_key'] = normalize_course(values.get('course'))
+        values['price_cents'] = parse_price(values.get('price'))
+        return values
 
     @property
     def serialize(self):
@@ -198,3 +479,145 @@ class MenuItem(db.Model):
         }
 
 
+class MenuDocument(db.Model):
+    """ encoded JSON menu of a restaurant, rebuilt in the transaction that
+    changes the menu so it is served without loading menu items
+    """
+    __tablename__ = 'menu_document'
+    FIELDS = ('name', 'description', 'id', 'price', 'course')
+
+    restaurant_id = db.Column(db.Integer,
+                              db.ForeignKey('restaurant.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True)
+    # menu_version of the restaurant the document was built from
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime())
+    json_body = db.Column(db.LargeBinary())
+    gzip_body = db.Column(db.LargeBinary())
+
+    @staticmethod
+    def mark_stale(session, restaurant_id):
+        """ rebuild the document of the restaurant before the session
+        commits
+        """
+        session.info.setdefault('stale_menus', set()).add(restaurant_id)
+
+    @staticmethod
+    def encode(menu_items):
+        """ compact JSON, with the same keys and order as jsonify
+        :return: (json bytes, gzip bytes)
+        """
+        data = json.dumps({'menu_items': menu_items}, sort_keys=True,
+                          separators=(',', ':')).encode('utf-8')
+        return data, gzip.compress(data, 9)
+
+    @staticmethod
+    def build(restaurant_ids, session=None):
+        """ documents of restaurants from their current rows, without
+        writing them
+        :param restaurant_ids: at most a few hundred restaurant ids
+        :param session: session of the transaction, default db.session
+        :return: list of dicts with the columns of menu_document, for the
+        restaurants that exist
+        """
+        session = session or db.session()
+        restaurants = session.query(
+            Restaurant.id, Restaurant.menu_version,
+            Restaurant.menu_updated_at) \
+            .filter(Restaurant.id.in_(restaurant_ids)).all()
+        menus = {restaurant.id: [] for restaurant in restaurants}
+        columns = [getattr(MenuItem, field) for field in MenuDocument.FIELDS]
+        rows = session.query(MenuItem.restaurant_id, MenuItem.course_key,
+                             *columns) \
+            .filter(MenuItem.restaurant_id.in_(restaurant_ids)) \
+            .order_by(MenuItem.restaurant_id, MenuItem.course_key,
+                      MenuItem.id)
+        for row in rows:
+            menus[row[0]].append((row[1], dict(zip(MenuDocument.FIELDS,
+                                                   row[2:]))))
+        documents = []
+        for restaurant in restaurants:
+            # standard courses first, like the menu page
+            items = sorted(menus[restaurant.id],
+                           key=lambda item: course_order(item[0]))
+            data, compressed = MenuDocument.encode(
+                [item for course_key, item in items])
+            documents.append({
+                'restaurant_id': restaurant.id,
+                'version': restaurant.menu_version,
+                'updated_at': restaurant.menu_updated_at,
+                'json_body': data,
+                'gzip_body': compressed,
+            })
+        return documents
+
+    @staticmethod
+    def rebuild(restaurant_ids, session=None, chunk_size=500):
+        """ write the documents of restaurants from their current rows
+        :param restaurant_ids: iterable of restaurant ids
+        :param session: session of the transaction, default db.session
+        """
+        session = session or db.session()
+        restaurant_ids = sorted(restaurant_ids)
+        table = MenuDocument.__table__
+        for start in range(0, len(restaurant_ids), chunk_size):
+            chunk = restaurant_ids[start:start + chunk_size]
+            documents = MenuDocument.build(chunk, session)
+            session.execute(table.delete().where(
+                table.c.restaurant_id.in_(chunk)))
+            if documents:
+                session.execute(table.insert(), documents)
+
+    def __repr__(self):
+        return '<MenuDocument %r %r>' % (self.restaurant_id, self.version)
+
+
+@event.listens_for(Session, 'before_commit')
+def _rebuild_menu_documents(session):
+    stale = session.info.pop('stale_menus', None)
+    if stale:
+        # the menu changes must be written before they are read back
+        session.flush()
+        MenuDocument.rebuild(stale, session)
+
+
+class OutboxMessage(db.Model):
+    """ email waiting to be delivered by the mail queue, see app.mail_queue
+    """
+    __tablename__ = 'outbox'
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255))
+    sender = db.Column(db.String(255))
+    # JSON list of addresses, comma separated in rows of older versions
+    recipients = db.Column(db.Text())
+    body = db.Column(db.Text())
+    html = db.Column(db.Text())
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    # set by the worker that is sending the message
+    claim = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime())
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime())
+    last_error = db.Column(db.Text())
+
+    # workers look for: status = 'pending' AND next_attempt_at <= now
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    @property
+    def recipient_list(self):
+        if self.recipients.startswith('['):
+            return json.loads(self.recipients)
+        return self.recipients.split(',')
+
+    def __repr__(self):
+        return '<OutboxMessage %r %r>' % (self.id, self.status)
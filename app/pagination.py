@@ -0,0 +1,78 @@
+from flask import abort, current_app, request
+
+from .models import MAX_ID
+
+
+class KeysetPage:
+    """ one page of rows selected by a keyset cursor
+
+    Rows are fetched with ``WHERE key > cursor ORDER BY key LIMIT n`` instead
+    of ``OFFSET``, so the cost of a page does not grow with its position in
+    the table.
+    """
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def page_args(default_setting='RESTAURANTS_PER_PAGE'):
+    """ read ``after``, ``before`` and ``per_page`` from the query string
+    :return: tuple (after, before, per_page), aborts with 400 on a cursor
+    outside the 64 bit key range or a per_page below 1
+    """
+    default = current_app.config.get(default_setting, 50)
+    maximum = current_app.config.get('MAX_PER_PAGE', 500)
+    per_page = request.args.get('per_page', default, type=int)
+    if per_page < 1:
+        abort(400)
+    per_page = min(per_page, maximum)
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    for cursor in (after, before):
+        if cursor is not None and abs(cursor) > MAX_ID:
+            abort(400)
+    return after, before, per_page
+
+
+def keyset_paginate(query, key, after=None, before=None, per_page=50):
+    """ paginate query on a unique, indexed column
+    :param query: sqlalchemy query
+    :param key: column to order and filter on, e.g. Restaurant.id
+    :param after: return rows with key greater than this cursor
+    :param before: return rows with key smaller than this cursor
+    :param per_page: maximum number of rows on the page
+    :return: KeysetPage
+    """
+    # fetch one extra row to find out whether another page exists
+    if before is not None:
+        rows = query.filter(key < before).order_by(key.desc()) \
+            .limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        prev_cursor = _key_of(rows[0], key) if has_more and rows else None
+        next_cursor = _key_of(rows[-1], key) if rows else None
+        return KeysetPage(rows, per_page, next_cursor, prev_cursor)
+
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = _key_of(rows[-1], key) if has_more else None
+    prev_cursor = _key_of(rows[0], key) if after is not None and rows else None
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor)
+
+
+def _key_of(row, key):
+    return getattr(row, key.key)
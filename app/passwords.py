@@ -0,0 +1,174 @@
+'''
+- password hashing with the method and iterations of the PASSWORD_HASH_*
+  settings, hashes made with other settings are upgraded at login
+- hashing runs in a small process pool, so a burst of logins does not hold
+  the GIL of the worker that serves other requests; pool processes are
+  started by a forkserver, not forked from a threaded worker
+- failed logins are counted per account and client address, and per client
+  address, blocked attempts are rejected before any hashing; failures from
+  one address do not lock the account for other addresses
+'''
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """ all slots of the hashing pool stayed in use """
+
+
+class LoginThrottled(Exception):
+    """ too many failed logins, retry_after is in seconds """
+    def __init__(self, retry_after):
+        super(LoginThrottled, self).__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256'
+        self.salt_length = 16
+        self.workers = 0
+        self.timeout = 10
+        self._slots = None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('PASSWORD_HASH_ITERATIONS', 150000)
+        app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 32)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.extensions['password_hasher'] = self
+        method = app.config['PASSWORD_HASH_METHOD']
+        iterations = app.config['PASSWORD_HASH_ITERATIONS']
+        if method.startswith('pbkdf2:') and iterations:
+            method = '%s:%d' % (method, iterations)
+        self.method = method
+        self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(
+            app.config['PASSWORD_HASH_QUEUE'])
+
+    def hash(self, password):
+        """ hash password with the configured method
+        :return: werkzeug password hash
+        """
+        return self._call(generate_password_hash, password, self.method,
+                          self.salt_length)
+
+    def verify(self, password_hash, password):
+        """ check password against a hash made with any method
+        :return: True if the password matches
+        """
+        if not password_hash:
+            return False
+        return self._call(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """ whether the hash was made with other settings than configured
+        """
+        method = password_hash.split('$', 1)[0]
+        return method != self.method
+
+    def _call(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        try:
+            return self._executor().submit(function, *args).result()
+        except BrokenProcessPool:
+            # a pool process died, start a new pool on the next call
+            self._pool = None
+            return function(*args)
+        finally:
+            self._slots.release()
+
+    def _executor(self):
+        # pools do not survive a fork, every gunicorn worker starts its own;
+        # forking a worker with running threads can copy locks that are held
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+
+class LoginThrottle:
+    """ failed login counters per account and address, and per address
+
+    Each key holds its failure count and the time of its first failure in
+    the current window; the least recently failed keys are dropped beyond
+    LOGIN_THROTTLE_SIZE entries.
+    """
+    def __init__(self, app=None):
+        self.limits = {'account': 5, 'address': 50}
+        self.window = 900
+        self.size = 100000
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5)
+        app.config.setdefault('LOGIN_MAX_FAILURES_PER_ADDRESS', 50)
+        app.config.setdefault('LOGIN_FAILURE_WINDOW', 900)
+        app.config.setdefault('LOGIN_THROTTLE_SIZE', 100000)
+        app.extensions['login_throttle'] = self
+        self.limits = {
+            'account': app.config['LOGIN_MAX_FAILURES_PER_ACCOUNT'],
+            'address': app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'],
+        }
+        self.window = app.config['LOGIN_FAILURE_WINDOW']
+        self.size = app.config['LOGIN_THROTTLE_SIZE']
+
+    @staticmethod
+    def keys(email, address):
+        return (('account', ((email or '').strip().lower(), address or '')),
+                ('address', address or ''))
+
+    def check(self, keys):
+        """ raise LoginThrottled when any of the keys has too many failures
+        """
+        now = time.time()
+        for key in keys:
+            entry = self._failures.get(key)
+            if entry is None or now - entry[1] >= self.window:
+                continue
+            if entry[0] >= self.limits[key[0]]:
+                raise LoginThrottled(int(entry[1] + self.window - now) + 1)
+
+    def failed(self, keys):
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._failures.pop(key, None)
+                if entry is None or now - entry[1] >= self.window:
+                    entry = (0, now)
+                self._failures[key] = (entry[0] + 1, entry[1])
+            while len(self._failures) > self.size:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, keys):
+        """ forget the failures of the account from this address, not
+        those of the address
+        """
+        with self._lock:
+            self._failures.pop(keys[0], None)
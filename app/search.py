@@ -0,0 +1,323 @@
+'''
+- full text search over menu items and the name of their restaurant
+- uses an sqlite FTS5 table when the database supports it, otherwise an
+  inverted index held in memory by each worker
+- the menu views keep the index in sync, see SearchIndex.index_item etc.
+'''
+
+import bisect
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy.exc import OperationalError
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# relative weight of a match in each field
+WEIGHTS = (('name', 10.0), ('description', 2.0), ('course', 1.0),
+           ('restaurant_name', 5.0))
+
+SearchHit = namedtuple('SearchHit', ['item_id', 'score'])
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+def _documents(db, restaurant_id=None, item_id=None):
+    """ rows to index: menu item id, restaurant id and the text fields """
+    from .models import MenuItem, Restaurant
+    query = db.session.query(
+        MenuItem.id, MenuItem.restaurant_id, MenuItem.name,
+        MenuItem.description, MenuItem.course,
+        Restaurant.name.label('restaurant_name'),
+    ).join(Restaurant, MenuItem.restaurant_id == Restaurant.id)
+    if restaurant_id is not None:
+        query = query.filter(MenuItem.restaurant_id == restaurant_id)
+    if item_id is not None:
+        query = query.filter(MenuItem.id == item_id)
+    return query.order_by(MenuItem.id)
+
+
+class FTS5Backend:
+    """ sqlite FTS5 virtual table, ranked with bm25 """
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def available(db):
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            exists = db.session.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'menu_search'"
+            ).first()
+            if not exists:
+                db.session.execute(
+                    "CREATE VIRTUAL TABLE menu_search USING fts5("
+                    "name, description, course, restaurant_name, "
+                    "item_id UNINDEXED, restaurant_id UNINDEXED)")
+                db.session.commit()
+                FTS5Backend(db).rebuild()
+        except OperationalError:
+            # sqlite compiled without fts5
+            db.session.rollback()
+            return False
+        return True
+
+    def rebuild(self):
+        self.db.session.execute('DELETE FROM menu_search')
+        self._insert()
+        self.db.session.commit()
+
+    def _insert(self, **filters):
+        query = _documents(self.db, **filters)
+        rows = [{'item_id': row.id, 'restaurant_id': row.restaurant_id,
+                 'name': row.name, 'description': row.description,
+                 'course': row.course,
+                 'restaurant_name': row.restaurant_name} for row in query]
+        if rows:
+            self.db.session.execute(
+                'INSERT INTO menu_search (item_id, restaurant_id, name, '
+                'description, course, restaurant_name) VALUES (:item_id, '
+                ':restaurant_id, :name, :description, :course, '
+                ':restaurant_name)', rows)
+
+    def index_item(self, item_id):
+        self.db.session.execute(
+            'DELETE FROM menu_search WHERE item_id = :id', {'id': item_id})
+        self._insert(item_id=item_id)
+        self.db.session.commit()
+
+    def remove_item(self, item_id):
+        self.db.session.execute(
+            'DELETE FROM menu_search WHERE item_id = :id', {'id': item_id})
+        self.db.session.commit()
+
+    def index_restaurant(self, restaurant_id):
+        self.remove_restaurant(restaurant_id)
+        self._insert(restaurant_id=restaurant_id)
+        self.db.session.commit()
+
+    def remove_restaurant(self, restaurant_id):
+        self.db.session.execute(
+            'DELETE FROM menu_search WHERE restaurant_id = :id',
+            {'id': restaurant_id})
+        self.db.session.commit()
+
+    def search(self, terms, offset, limit):
+        # every term must match, each as a prefix
+        match = ' '.join('"%s"*' % term for term in terms)
+        total = self.db.session.execute(
+            'SELECT count(*) FROM menu_search WHERE menu_search MATCH :q',
+            {'q': match}).scalar()
+        # bm25 is lower for better matches
+        rows = self.db.session.execute(
+            'SELECT item_id, bm25(menu_search, %s) AS rank '
+            'FROM menu_search WHERE menu_search MATCH :q '
+            'ORDER BY rank LIMIT :limit OFFSET :offset'
+            % ', '.join(str(weight) for field, weight in WEIGHTS),
+            {'q': match, 'limit': limit, 'offset': offset})
+        return total, [SearchHit(row.item_id, round(-row.rank, 4))
+                       for row in rows]
+
+
+class MemoryBackend:
+    """ inverted index of token -> {item id: weighted term frequency}
+    the sorted vocabulary gives prefix lookups with bisect
+    each worker holds its own copy, rebuilt from the database every
+    rebuild_interval seconds to pick up changes made by other workers
+    """
+    def __init__(self, db, rebuild_interval=300):
+        self.db = db
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._built_at = None
+
+    def rebuild(self):
+        with self._lock:
+            self._postings = {}
+            self._vocabulary = []
+            self._documents = {}
+            for row in _documents(self.db):
+                self._add(row)
+            self._built_at = time.time()
+
+    def _ensure(self):
+        if self._built_at is None or (
+                self.rebuild_interval and
+                time.time() - self._built_at > self.rebuild_interval):
+            self.rebuild()
+
+    def _add(self, row):
+        weights = {}
+        for field, weight in WEIGHTS:
+            for token in tokenize(getattr(row, field)):
+                weights[token] = weights.get(token, 0) + weight
+        self._documents[row.id] = (row.restaurant_id, list(weights))
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[row.id] = weight
+
+    def _remove(self, item_id):
+        document = self._documents.pop(item_id, None)
+        if document is None:
+            return
+        for token in document[1]:
+            postings = self._postings[token]
+            postings.pop(item_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[index]
+
+    def index_item(self, item_id):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(item_id)
+            for row in _documents(self.db, item_id=item_id):
+                self._add(row)
+
+    def remove_item(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def index_restaurant(self, restaurant_id):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove_restaurant(restaurant_id)
+            for row in _documents(self.db, restaurant_id=restaurant_id):
+                self._add(row)
+
+    def remove_restaurant(self, restaurant_id):
+        with self._lock:
+            self._remove_restaurant(restaurant_id)
+
+    def _remove_restaurant(self, restaurant_id):
+        for item_id in [item_id for item_id, document
+                        in self._documents.items()
+                        if document[0] == restaurant_id]:
+            self._remove(item_id)
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, terms, offset, limit):
+        with self._lock:
+            self._ensure()
+            count = len(self._documents) or 1
+            scores = None
+            for term in terms:
+                # best scoring expansion of the prefix, per document
+                term_scores = {}
+                for token in self._expand(term):
+                    postings = self._postings[token]
+                    idf = math.log(1 + count / len(postings))
+                    for item_id, weight in postings.items():
+                        score = weight * idf
+                        if score > term_scores.get(item_id, 0):
+                            term_scores[item_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {item_id: score + term_scores[item_id]
+                              for item_id, score in scores.items()
+                              if item_id in term_scores}
+                if not scores:
+                    return 0, []
+        ranked = sorted(scores.items(), key=lambda hit: (-hit[1], hit[0]))
+        return len(ranked), [SearchHit(item_id, round(score, 4))
+                             for item_id, score
+                             in ranked[offset:offset + limit]]
+
+
+class SearchIndex:
+    """ search extension, the backend is picked on first use:
+    SEARCH_BACKEND 'auto' uses fts5 when available, else 'memory'
+    """
+    def __init__(self, app=None):
+        self.app = None
+        self._backend = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')
+        app.config.setdefault('SEARCH_MEMORY_REBUILD_INTERVAL', 300)
+        self.app = app
+        app.extensions['search_index'] = self
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from . import db
+            with self._lock:
+                if self._backend is None:
+                    name = self.app.config['SEARCH_BACKEND']
+                    if name in ('auto', 'fts5') and \
+                            FTS5Backend.available(db):
+                        self._backend = FTS5Backend(db)
+                    elif name == 'fts5':
+                        raise RuntimeError('sqlite fts5 is not available')
+                    else:
+                        self._backend = MemoryBackend(
+                            db, self.app.config[
+                                'SEARCH_MEMORY_REBUILD_INTERVAL'])
+        return self._backend
+
+    def _update(self, method, key):
+        # a memory index that was never queried is built on first search
+        if self._backend is not None or \
+                self.app.config['SEARCH_BACKEND'] != 'memory':
+            getattr(self.backend, method)(key)
+
+    def index_item(self, item_id):
+        """ add or refresh a menu item, call after commit """
+        self._update('index_item', item_id)
+
+    def remove_item(self, item_id):
+        self._update('remove_item', item_id)
+
+    def index_restaurant(self, restaurant_id):
+        """ refresh all items of a restaurant, e.g. after a rename """
+        self._update('index_restaurant', restaurant_id)
+
+    def remove_restaurant(self, restaurant_id):
+        self._update('remove_restaurant', restaurant_id)
+
+    def rebuild(self):
+        self.backend.rebuild()
+
+    def invalidate(self):
+        """ index is out of date, e.g. after a bulk load """
+        if isinstance(self._backend, MemoryBackend):
+            self._backend._built_at = None
+        elif self._backend is not None or \
+                self.app.config['SEARCH_BACKEND'] != 'memory':
+            self.backend.rebuild()
+
+    def search(self, query, page=1, per_page=20):
+        """ find menu items matching every word of query, words match as
+        prefixes, best matches first
+        :return: tuple (total number of hits, list of SearchHit on the page)
+        """
+        terms = tokenize(query)
+        if not terms:
+            return 0, []
+        return self.backend.search(terms, (page - 1) * per_page, per_page)
@@ -0,0 +1,143 @@
+'''
+- bulk load restaurants and menu items from a data file or synthetic data
+- rows are written with batched core insert statements (executemany),
+  all in one transaction
+'''
+
+import csv
+import json
+import random
+import time
+from itertools import islice
+
+from . import db, menu_cache, fragment_cache, search_index
+from .models import Restaurant, MenuItem, MenuDocument, COURSES, \
+    sqlite_sequence
+
+
+def read_data(path):
+    """ read restaurants from a JSON or CSV file
+
+    JSON: {"restaurants": [{"name": ..., "menu_items": [{"name": ...,
+    "description": ..., "price": ..., "course": ...}]}]}
+
+    CSV: header restaurant,name,description,price,course with one menu item
+    per line, items of a restaurant on consecutive lines
+    :return: iterator of restaurant dicts
+    """
+    if path.endswith('.csv'):
+        return _read_csv(path)
+    with open(path) as f:
+        data = json.load(f)
+    return iter(data['restaurants'] if isinstance(data, dict) else data)
+
+
+def _read_csv(path):
+    with open(path, newline='') as f:
+        restaurant = None
+        for line in csv.DictReader(f):
+            if restaurant is None or line['restaurant'] != restaurant['name']:
+                if restaurant is not None:
+                    yield restaurant
+                restaurant = {'name': line['restaurant'], 'menu_items': []}
+            if line.get('name'):
+                restaurant['menu_items'].append({
+                    'name': line['name'],
+                    'description': line.get('description'),
+                    'price': line.get('price'),
+                    'course': line.get('course'),
+                })
+        if restaurant is not None:
+            yield restaurant
+
+
+def synthesize(restaurants, items, seed=0):
+    """ generate fake restaurants for load testing
+    :param restaurants: number of restaurants
+    :param items: number of menu items per restaurant
+    :return: iterator of restaurant dicts
+    """
+    rnd = random.Random(seed)
+    for r in range(restaurants):
+        yield {
+            'name': 'Restaurant %d' % (r + 1),
+            'menu_items': [{
+                'name': 'Dish %d-%d' % (r + 1, i + 1),
+                'description': 'Synthetic menu item %d of restaurant %d'
+                               % (i + 1, r + 1),
+                'price': '$%d.%02d' % (rnd.randint(1, 40),
+                                       rnd.choice((0, 49, 50, 95, 99))),
+                'course': rnd.choice(COURSES).capitalize(),
+            } for i in range(items)],
+        }
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_load(restaurants, chunk_size=1000):
+    """ insert restaurants and their menu items
+    ids of the new restaurants are assigned up front from max(id) and the
+    sqlite sequence, so no other process may insert restaurants while the
+    load runs
+    :param restaurants: iterable of restaurant dicts, see read_data
+    :param chunk_size: number of rows per executemany batch
+    :return: dict with row counts, elapsed seconds and rows per second
+    """
+    start = time.time()
+    next_id = (db.session.query(db.func.max(Restaurant.id)).scalar() or 0) + 1
+    if db.engine.dialect.name == 'sqlite':
+        next_id = max(next_id, sqlite_sequence('restaurant') + 1)
+    first_id = next_id
+    restaurant_insert = Restaurant.__table__.insert()
+    item_insert = MenuItem.__table__.insert()
+    counts = {'restaurants': 0, 'menu_items': 0}
+    items = []
+
+    def flush_items():
+        if items:
+            db.session.execute(item_insert, items)
+            counts['menu_items'] += len(items)
+            del items[:]
+
+    for chunk in _chunks(restaurants, chunk_size):
+        rows = []
+        for restaurant in chunk:
+            rows.append({'id': next_id, 'name': restaurant['name']})
+            for item in restaurant.get('menu_items', ()):
+                items.append(MenuItem.row({
+                    'name': item['name'],
+                    'description': item.get('description'),
+                    'price': item.get('price'),
+                    'course': item.get('course'),
+                    'restaurant_id': next_id,
+                }))
+                if len(items) >= chunk_size:
+                    # parents first, items reference the new restaurant ids
+                    if rows:
+                        db.session.execute(restaurant_insert, rows)
+                        counts['restaurants'] += len(rows)
+                        rows = []
+                    flush_items()
+            next_id += 1
+        if rows:
+            db.session.execute(restaurant_insert, rows)
+            counts['restaurants'] += len(rows)
+        flush_items()
+    MenuDocument.rebuild(range(first_id, next_id))
+    db.session.commit()
+    menu_cache.clear()
+    fragment_cache.clear()
+    search_index.invalidate()
+
+    elapsed = time.time() - start
+    total = counts['restaurants'] + counts['menu_items']
+    counts['seconds'] = round(elapsed, 3)
+    counts['rows_per_second'] = int(total / elapsed) if elapsed else total
+    return counts
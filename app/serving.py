@@ -0,0 +1,69 @@
+'''
+- production serving with gunicorn: a master process that pre-forks
+  worker processes, each running a pool of threads
+- every worker creates its own database connections after the fork
+- sqlite databases are switched to WAL mode, so readers don't block on
+  the writer
+'''
+
+import multiprocessing
+
+from . import db
+
+
+def default_workers():
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def enable_sqlite_wal(app):
+    """ switch an sqlite database to write-ahead logging, the mode is stored
+    in the database file so this is needed once, not per connection
+    :return: journal mode, None if the database is not sqlite
+    """
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return None
+        mode = db.session.execute('PRAGMA journal_mode=WAL').scalar()
+        db.session.remove()
+        return mode
+
+
+def _post_fork(app):
+    def post_fork(server, worker):
+        # connections opened in the master must not be shared by workers
+        with app.app_context():
+            db.engine.dispose()
+    return post_fork
+
+
+def run(app, bind=None, workers=None, threads=None, timeout=None):
+    """ serve app with gunicorn, settings default to the SERVER_* config
+    """
+    from gunicorn.app.base import BaseApplication
+
+    config = app.config
+    options = {
+        'bind': bind or config.get('SERVER_BIND', '0.0.0.0:8000'),
+        'workers': workers or config.get('SERVER_WORKERS') or
+        default_workers(),
+        'threads': threads or config.get('SERVER_THREADS', 1),
+        'timeout': timeout or config.get('SERVER_TIMEOUT', 30),
+        # import the app once in the master, workers fork from it
+        'preload_app': True,
+        'post_fork': _post_fork(app),
+    }
+    if options['threads'] > 1:
+        options['worker_class'] = 'gthread'
+
+    if config.get('SQLITE_WAL', True):
+        enable_sqlite_wal(app)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
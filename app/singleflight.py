@@ -0,0 +1,88 @@
+'''
+- request coalescing: concurrent calls with the same key, within one
+  worker process, wait for the first one and share its result
+- used in front of the database reads of the hot menu and restaurant
+  endpoints, results must be plain data, not objects of a session
+- in flight keys and their number of waiting threads are reported by
+  stats(), see /cache/JSON
+'''
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.executions = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SINGLE_FLIGHT_ENABLED', True)
+        app.extensions['single_flight'] = self
+        self.enabled = app.config['SINGLE_FLIGHT_ENABLED']
+
+    def do(self, key, function):
+        """ call function, or wait for the call with the same key that is
+        already running and return its result
+        exceptions of the call are raised in every waiting thread too
+        :param key: hashable key of the call, e.g. ('menu', restaurant_id)
+        :param function: function without arguments
+        :return: result of function
+        """
+        if not self.enabled:
+            return function()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """ :return: dict with totals and the waiters per key in flight """
+        with self._lock:
+            waiters = {_name(key): call.waiters
+                       for key, call in self._calls.items()}
+        return {
+            'enabled': self.enabled,
+            'executions': self.executions,
+            'shared': self.shared,
+            'in_flight': len(waiters),
+            'waiters': waiters,
+        }
+
+
+def _name(key):
+    if isinstance(key, tuple):
+        return ':'.join(str(part) for part in key)
+    return str(key)
@@ -0,0 +1,70 @@
+'''
+- compile every template into the shared jinja bytecode cache, so new
+  workers load compiled templates instead of parsing them
+- measure how long a cold start takes
+'''
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def bytecode_cache(app):
+    """ filesystem bytecode cache shared by all workers on the machine
+    :return: FileSystemBytecodeCache, None when disabled
+    """
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if not directory:
+        return None
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app):
+    """ compile all templates of the app and its blueprints, including
+    bootstrap/, auth/ and mail/, writing them to the bytecode cache
+    :return: list of (template name, seconds)
+    """
+    timings = []
+    env = app.jinja_env
+    for name in sorted(env.list_templates()):
+        if not name.endswith(('.html', '.txt')):
+            continue
+        start = time.perf_counter()
+        env.get_template(name)
+        timings.append((name, time.perf_counter() - start))
+    return timings
+
+
+# runs in a fresh interpreter, so nothing is imported or compiled yet
+_PROBE = '''
+import json, os, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+with app.test_request_context():
+    for name in sys.argv[2:]:
+        app.jinja_env.get_template(name)
+loaded = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'templates': loaded - created, 'total': loaded - start}))
+'''
+
+
+def measure_startup(config_name, templates):
+    """ time a cold start in a new python process: importing the app,
+    create_app and loading templates
+    :return: dict phase: seconds
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', _PROBE, config_name] + list(templates),
+        cwd=root)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
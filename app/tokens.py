@@ -0,0 +1,119 @@
+'''
+- bearer token authentication for machine clients of the JSON api
+- tokens are signed, expire and carry the permissions of the user, so they
+  are verified without a database query
+- revoked tokens are kept in an in-memory denylist until they expire, per
+  process, so keep API_TOKEN_EXPIRATION short with several workers
+'''
+
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
+from flask_login import current_user
+from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, \
+    BadData
+
+from .models import User, Permission, API_TOKEN_SALT
+from .passwords import HashingBusy, LoginThrottled
+
+token_auth = HTTPTokenAuth(scheme='Bearer')
+basic_auth = HTTPBasicAuth()
+
+
+class Denylist:
+    """ ids of revoked tokens, each kept until the token expires """
+    def __init__(self):
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires):
+        with self._lock:
+            self._prune(time.time())
+            self._expires[jti] = expires
+
+    def __contains__(self, jti):
+        return jti in self._expires
+
+    def __len__(self):
+        return len(self._expires)
+
+    def _prune(self, now):
+        for jti in [jti for jti, expires in self._expires.items()
+                    if expires <= now]:
+            del self._expires[jti]
+
+
+denylist = Denylist()
+
+
+class ApiUser:
+    """ user of a bearer token, built from its claims only """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, permissions, jti, expires):
+        self.id = id
+        self.permissions = permissions
+        self.jti = jti
+        self.expires = expires
+
+    def can(self, permissions):
+        return (self.permissions & permissions) == permissions
+
+    @property
+    def is_administrator(self):
+        return self.can(Permission.ADMINISTER)
+
+
+def verify_api_token(token):
+    """ check signature, expiry and revocation of a bearer token
+    :return: ApiUser, None when the token is not valid
+    """
+    s = Serializer(current_app.config['SECRET_KEY'], salt=API_TOKEN_SALT)
+    try:
+        data, header = s.loads(token, return_header=True)
+    except BadData:
+        return None
+    if not isinstance(data, dict) or data.get('jti') in denylist:
+        return None
+    return ApiUser(data.get('id'), data.get('perm', 0), data.get('jti'),
+                   header.get('exp'))
+
+
+def current_api_user():
+    """ user of the bearer token of this request, else the session user
+    """
+    return g.get('api_user') or current_user._get_current_object()
+
+
+@token_auth.verify_token
+def _verify_token(token):
+    g.api_user = verify_api_token(token) if token else None
+    return g.api_user is not None
+
+
+@token_auth.error_handler
+def _token_error():
+    return jsonify(error='invalid or expired token'), 401
+
+
+@basic_auth.verify_password
+def _verify_password(email, password):
+    # without credentials the logged in user of the session gets the token
+    if not email:
+        g.token_user = current_user._get_current_object() \
+            if current_user.is_authenticated else None
+    else:
+        try:
+            g.token_user = User.authenticate(email, password,
+                                             request.remote_addr)
+        except (LoginThrottled, HashingBusy):
+            g.token_user = None
+    return g.token_user is not None
+
+
+@basic_auth.error_handler
+def _credentials_error():
+    return jsonify(error='invalid credentials'), 401
@@ -13,6 +13,83 @@ class Config:
     MENU_ADMIN = os.environ.get('MENU_ADMIN')
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    RESTAURANTS_PER_PAGE = int(os.environ.get('RESTAURANTS_PER_PAGE', 50))
+    USERS_PER_PAGE = 50
+    # lifetime in seconds of bearer tokens of the JSON api
+    API_TOKEN_EXPIRATION = int(os.environ.get('API_TOKEN_EXPIRATION', 3600))
+    API_TOKEN_MAX_EXPIRATION = 24 * 3600
+    # password hashes made with other settings are replaced at login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD',
+                                          'pbkdf2:sha256')
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS',
+                                                  150000))
+    PASSWORD_SALT_LENGTH = 16
+    # processes per worker that hash passwords, 0 hashes on the request
+    # thread; at most PASSWORD_HASH_QUEUE hashes wait for one
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = 32
+    PASSWORD_HASH_TIMEOUT = 10
+    # failed logins allowed per window of seconds, the account limit counts
+    # per account and client address, so nobody can lock others out
+    LOGIN_MAX_FAILURES_PER_ACCOUNT = 5
+    LOGIN_MAX_FAILURES_PER_ADDRESS = 50
+    LOGIN_FAILURE_WINDOW = 900
+    LOGIN_THROTTLE_SIZE = 100000
+    MAX_PER_PAGE = 500
+    # menu cache backend: 'lru' (per worker), 'shared' or 'null' (disabled)
+    # 'shared' uses redis at MENU_CACHE_URL, or an in-process stand-in
+    MENU_CACHE_BACKEND = os.environ.get('MENU_CACHE_BACKEND', 'lru')
+    MENU_CACHE_URL = os.environ.get('MENU_CACHE_URL')
+    MENU_CACHE_SIZE = 1024
+    MENU_CACHE_TTL = 300
+    # logged in users and their role, shared between requests for a few
+    # seconds; 'null' loads the user once per request
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'null')
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 30
+    # rendered html of restaurants and menu items in lists
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'lru')
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+    FRAGMENT_CACHE_SIZE = 10000
+    FRAGMENT_CACHE_TTL = 3600
+    # serialized and compressed JSON api bodies, by etag and variant
+    ENCODED_CACHE_BACKEND = os.environ.get('ENCODED_CACHE_BACKEND', 'lru')
+    ENCODED_CACHE_URL = os.environ.get('ENCODED_CACHE_URL')
+    ENCODED_CACHE_SIZE = 512
+    ENCODED_CACHE_TTL = 3600
+    # JSON api bodies smaller than this many bytes are not compressed
+    COMPRESS_MIN_SIZE = 1024
+    # zlib level for gzip and deflate, brotli uses a quality of level - 1
+    # capped at 6
+    COMPRESS_LEVEL = 6
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    # concurrent identical reads of the hot menu endpoints share one query
+    SINGLE_FLIGHT_ENABLED = True
+    # maximum number of menu items in one bulk request
+    BULK_MAX_ITEMS = 5000
+    # restaurants per /menus/JSON request
+    MENUS_BATCH_MAX = int(os.environ.get('MENUS_BATCH_MAX', 100))
+    # 'auto' uses sqlite fts5 when available, otherwise 'memory'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_PER_PAGE = 20
+    # deepest result reachable with ?page=, deeper pages are answered with 400
+    SEARCH_MAX_OFFSET = 10000
+    # request/sql/template instrumentation, served at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() == 'true'
+    METRICS_SLOW_QUERY_MS = 100
+    # fraction of requests to profile with cProfile, 0 disables
+    METRICS_PROFILE_RATE = float(os.environ.get('METRICS_PROFILE_RATE', 0))
+    METRICS_PROFILE_DIR = os.path.join(basedir, 'tmp', 'profiles')
+    # compiled templates, shared by all workers; empty disables the cache
+    TEMPLATE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(basedir, 'tmp', 'jinja-cache'))
+    # email is stored in the outbox table and sent by background workers
+    MAIL_QUEUE_ENABLED = True
+    MAIL_QUEUE_WORKERS = 2
+    MAIL_QUEUE_BATCH_SIZE = 20
+    MAIL_QUEUE_MAX_ATTEMPTS = 5
+    # seconds before the first retry, doubled on every next attempt
+    MAIL_QUEUE_RETRY_DELAY = 30
 
     @staticmethod
     def init_app(app):
@@ -25,9 +102,10 @@ class DevelopmentConfig(Config):
     MAIL_SENDER = os.environ.get('MAIL_SENDER')
     MAIL_TO = os.environ.get('MAIL_TO')
     MAIL_SUBJECT_PREFIX = '[Menu App]'
-    MAIL_SERVER = 'smtp.googlemail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    # point these at a local debugging smtp server to test delivery
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     SECRET_KEY = 'bla'
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
@@ -37,11 +115,31 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    SECRET_KEY = 'testing'
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir,
                                                           'data-test.sqlite')
     # disable CSRF tokens in tests
     WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_ITERATIONS = 1000
+    MENU_CACHE_BACKEND = 'null'
+    MAIL_QUEUE_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    # tests must not write compiled templates into the working tree
+    TEMPLATE_CACHE_DIR = ''
+
+
+class BenchmarkConfig(Config):
+    # the database is dropped and seeded by `manage.py bench`
+    SECRET_KEY = 'benchmark'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL') or \
+                              'sqlite:///' + os.path.join(basedir,
+                                                          'data-bench.sqlite')
+    WTF_CSRF_ENABLED = False
+    MAIL_QUEUE_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    MAIL_SUBJECT_PREFIX = '[Menu App]'
 
 
 class ProductionConfig(Config):
@@ -49,12 +147,33 @@ class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
                               'sqlite:///' + os.path.join(basedir,
                                                           'data.sqlite')
+    # connections per worker process
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    # below the server side idle timeout, e.g. mysql wait_timeout
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    # `manage.py serve` settings, workers default to 2 * cpus + 1
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0)) or None
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+    SERVER_TIMEOUT = 30
+    SQLITE_WAL = True
+
+    @staticmethod
+    def init_app(app):
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            # sqlite has no connection pool to size
+            for key in ('SQLALCHEMY_POOL_SIZE', 'SQLALCHEMY_MAX_OVERFLOW',
+                        'SQLALCHEMY_POOL_TIMEOUT', 'SQLALCHEMY_POOL_RECYCLE'):
+                app.config[key] = None
 
 
 config = {
     'development': DevelopmentConfig(),
     'testing': TestingConfig(),
     'production': ProductionConfig(),
+    'benchmark': BenchmarkConfig(),
 
     'default': DevelopmentConfig(),
 }
\ No newline at end of file
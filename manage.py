@@ -1,8 +1,11 @@
 #!/usr/bin/env python
+import hashlib
 import os
+from datetime import datetime
 
 from app import create_app, db
-from app.models import User, Role, Restaurant, MenuItem
+from app.models import User, Role, Restaurant, MenuItem, MenuDocument, \
+    parse_price
 from flask_script import Manager, Shell, Server
 from flask_migrate import Migrate, MigrateCommand
 
@@ -54,5 +57,261 @@ def test(coverage=False):
         print('HTML version: file://%s/index.html' % covdir)
         COV.erase()
 
+
+@manager.command
+def backfill():
+    """Fill derived columns of rows created before they existed"""
+    updated = MenuItem.query.filter(MenuItem.course_key.is_(None)).update(
+        {MenuItem.course_key: db.func.lower(db.func.trim(MenuItem.course))},
+        synchronize_session=False)
+    print('course_key: %d menu items updated' % updated)
+    # prices are parsed in python, '$.99' and '15' are not valid sql numbers
+    table = MenuItem.__table__
+    rows = [{'item_id': row.id, 'cents': parse_price(row.price)}
+            for row in db.session.query(MenuItem.id, MenuItem.price).filter(
+                MenuItem.price_cents.is_(None), MenuItem.price.isnot(None))]
+    if rows:
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('item_id'))
+            .values(price_cents=db.bindparam('cents')), rows)
+    print('price_cents: %d menu items updated' % len(rows))
+    now = datetime.utcnow()
+    for model in (Restaurant, MenuItem):
+        updated = model.query.filter(model.updated_at.is_(None)).update(
+            {model.updated_at: now}, synchronize_session=False)
+        print('updated_at: %d %s rows updated' % (updated,
+                                                   model.__tablename__))
+    Restaurant.query.filter(Restaurant.menu_updated_at.is_(None)).update(
+        {Restaurant.menu_updated_at: now}, synchronize_session=False)
+    # profile pages should not hash emails for the avatar
+    users = User.query.filter(User.avatar_hash.is_(None),
+                              User.email.isnot(None)).all()
+    for user in users:
+        user.avatar_hash = hashlib.md5(user.email.encode('utf-8')).hexdigest()
+    print('avatar_hash: %d users updated' % len(users))
+    missing = [row.id for row in db.session.query(Restaurant.id).outerjoin(
+        MenuDocument).filter(MenuDocument.restaurant_id.is_(None))]
+    MenuDocument.rebuild(missing)
+    print('menu_document: %d restaurants built' % len(missing))
+    db.session.commit()
+
+
+@manager.command
+def autoincrement():
+    """Recreate the sqlite restaurant and menu item tables with AUTOINCREMENT"""
+    from sqlalchemy.schema import CreateTable
+    if db.engine.dialect.name != 'sqlite':
+        print('%s does not reuse ids, nothing to do' % db.engine.dialect.name)
+        return
+    connection = db.engine.connect()
+    try:
+        # only takes effect outside a transaction, the copy keeps the ids
+        connection.execute('PRAGMA foreign_keys=OFF')
+        for model in (Restaurant, MenuItem):
+            table = model.__table__
+            sql = connection.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' "
+                "AND name = ?", table.name).scalar()
+            if sql is None or 'AUTOINCREMENT' in sql.upper():
+                print('%s: up to date' % table.name)
+                continue
+            copy = table.name + '_autoincrement'
+            names = ', '.join(column.name for column in table.columns)
+            create = str(CreateTable(table).compile(dialect=db.engine.dialect))
+            with connection.begin():
+                connection.execute(create.replace(
+                    'CREATE TABLE %s ' % table.name,
+                    'CREATE TABLE %s ' % copy, 1))
+                connection.execute('INSERT INTO %s (%s) SELECT %s FROM %s'
+                                   % (copy, names, names, table.name))
+                connection.execute('DROP TABLE %s' % table.name)
+                connection.execute('ALTER TABLE %s RENAME TO %s'
+                                   % (copy, table.name))
+                for index in table.indexes:
+                    index.create(connection)
+            print('%s: recreated with AUTOINCREMENT' % table.name)
+    finally:
+        connection.execute('PRAGMA foreign_keys=ON')
+        connection.close()
+
+
+@manager.option('-f', '--file', dest='path', default=None,
+                help='JSON or CSV file with restaurants and menu items')
+@manager.option('-r', '--restaurants', dest='restaurants', type=int, default=0,
+                help='number of synthetic restaurants')
+@manager.option('-m', '--items', dest='items', type=int, default=10,
+                help='number of synthetic menu items per restaurant')
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int,
+                default=1000, help='rows per insert batch')
+def seed(path, restaurants, items, chunk_size):
+    """Bulk load restaurants and menu items"""
+    from app.seed import bulk_load, read_data, synthesize
+    if path:
+        data = read_data(path)
+    elif restaurants:
+        data = synthesize(restaurants, items)
+    else:
+        print('pass --file or --restaurants')
+        return
+    result = bulk_load(data, chunk_size=chunk_size)
+    print('%(restaurants)d restaurants, %(menu_items)d menu items in '
+          '%(seconds).2fs (%(rows_per_second)d rows/s)' % result)
+
+
+@manager.option('-r', '--restaurants', dest='restaurants', type=int,
+                default=200, help='number of restaurants to seed')
+@manager.option('-m', '--items', dest='items', type=int, default=30,
+                help='number of menu items per restaurant')
+@manager.option('-u', '--users', dest='users', type=int, default=100,
+                help='number of users to seed')
+@manager.option('-n', '--requests', dest='requests', type=int, default=200,
+                help='requests per scenario')
+@manager.option('-s', '--server', dest='server', action='store_true',
+                help='run against a threaded wsgi server instead of the '
+                     'test client')
+@manager.option('-c', '--concurrency', dest='concurrency', type=int,
+                default=4, help='client threads with --server')
+@manager.option('-o', '--output', dest='output', default=None,
+                help='write results to this JSON file')
+@manager.option('-b', '--baseline', dest='baseline', default=None,
+                help='compare with the results in this JSON file')
+@manager.option('-f', '--force', dest='force', action='store_true',
+                help='compare with a baseline run with other settings')
+def bench(restaurants, items, users, requests, server, concurrency, output,
+          baseline, force):
+    """Seed a synthetic database and benchmark the main and auth views"""
+    from app import bench as benchmark
+    settings = {'restaurants': restaurants, 'items': items, 'users': users,
+                'requests': requests, 'server': server,
+                'concurrency': concurrency}
+    if baseline:
+        baseline_data = benchmark.load_baseline(baseline)
+        mismatch = benchmark.settings_mismatch(settings, baseline_data)
+        for name, old, new in mismatch:
+            print('%s: %s in %s, %s now' % (name, old, baseline, new))
+        if mismatch and not force:
+            print('the baseline was run with other settings, use --force to '
+                  'compare anyway')
+            return 1
+    bench_app = create_app('benchmark')
+    with bench_app.app_context():
+        ids = benchmark.seed(restaurants, items, users)
+    if server:
+        results = benchmark.run_server(bench_app, ids, requests, concurrency)
+    else:
+        results = benchmark.run_test_client(bench_app, ids, requests)
+
+    print('%-18s %8s %8s %8s %8s %10s %8s %6s' % (
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'mean ms', 'req/s',
+        'queries', 'errors'))
+    for name, r in sorted(results.items()):
+        print('%-18s %8.2f %8.2f %8.2f %8.2f %10.1f %8.2f %6d' % (
+            name, r['p50_ms'], r['p95_ms'], r['p99_ms'], r['mean_ms'],
+            r['throughput_rps'], r['queries_per_request'], r['errors']))
+
+    if output:
+        benchmark.save_results(output, settings, results)
+    if baseline:
+        print('\ncompared with %s' % baseline)
+        for name, metric, old, new, change, regression in \
+                benchmark.compare(results, baseline_data):
+            print('%-18s %-20s %10.2f %10.2f %+7.1f%%%s' % (
+                name, metric, old, new, change,
+                '  REGRESSION' if regression else ''))
+
+
+@manager.option('-b', '--bind', dest='bind', default=None,
+                help='address to listen on, e.g. 0.0.0.0:8000')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None,
+                help='number of worker processes')
+@manager.option('-t', '--threads', dest='threads', type=int, default=None,
+                help='number of threads per worker')
+def serve(bind, workers, threads):
+    """Run the app with gunicorn, for production"""
+    from app.serving import run
+    # the module app defaults to the development settings
+    run(create_app(os.getenv('MENU_CONFIG') or 'production'), bind=bind,
+        workers=workers, threads=threads)
+
+
+@manager.command
+def precompile():
+    """Compile all templates into the bytecode cache and time startup"""
+    from app.startup import precompile_templates, measure_startup
+    if not app.config.get('TEMPLATE_CACHE_DIR'):
+        print('TEMPLATE_CACHE_DIR is not set, nothing to precompile')
+        return
+    timings = precompile_templates(app)
+    for name, seconds in timings:
+        print('%8.2f ms  %s' % (seconds * 1000, name))
+    print('%d templates compiled in %.2f ms' % (
+        len(timings), sum(seconds for name, seconds in timings) * 1000))
+
+    config_name = os.getenv('MENU_CONFIG') or 'default'
+    names = [name for name, seconds in timings]
+    cached = measure_startup(config_name, names)
+    os.environ['TEMPLATE_CACHE_DIR'] = ''
+    try:
+        uncached = measure_startup(config_name, names)
+    finally:
+        os.environ['TEMPLATE_CACHE_DIR'] = app.config['TEMPLATE_CACHE_DIR']
+    print('\ncold start        %10s %10s' % ('no cache', 'cache'))
+    for phase in ('import', 'create_app', 'templates', 'total'):
+        print('%-17s %7.2f ms %7.2f ms' % (phase, uncached[phase] * 1000,
+                                           cached[phase] * 1000))
+
+
+@manager.command
+def explain():
+    """Show the query plans of the view queries, flag scans and sorts"""
+    from app.explain import audit
+    scans = sorts = 0
+    for description, details, full_scan, temp_sort in audit():
+        scans += full_scan
+        sorts += temp_sort
+        flag = 'SCAN' if full_scan else 'SORT' if temp_sort else 'ok  '
+        print('%s %s' % (flag, description))
+        for detail in details:
+            print('       ' + detail)
+    print('%d queries with a full table scan' % scans)
+    print('%d queries sorted in a temporary b-tree' % sorts)
+
+
+@manager.option('-o', '--output', dest='output', default=None,
+                help='file to write, default stdout')
+def export(output):
+    """Write all restaurants with their menus as NDJSON"""
+    import sys
+    from app.export import catalog_ndjson
+    f = open(output, 'w') if output else sys.stdout
+    try:
+        for line in catalog_ndjson():
+            f.write(line)
+    finally:
+        if output:
+            f.close()
+
+
+@manager.command
+def reindex():
+    """Rebuild the menu search index"""
+    from app import search_index
+    search_index.rebuild()
+    print('search index rebuilt (%s)' % type(search_index.backend).__name__)
+
+
+@manager.command
+def send_mail():
+    """Deliver all due messages in the outbox and exit"""
+    from app import mail_queue
+    sent = 0
+    while True:
+        batch = mail_queue.process_batch()
+        if not batch:
+            break
+        sent += batch
+    print('%d outbox messages processed' % sent)
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
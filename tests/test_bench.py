@@ -0,0 +1,35 @@
+import unittest
+
+from app.bench import compare, settings_mismatch
+
+SETTINGS = {'restaurants': 200, 'items': 30, 'users': 100, 'requests': 200,
+            'server': False, 'concurrency': 4}
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_same_settings(self):
+        self.assertEqual(settings_mismatch(
+            SETTINGS, {'settings': dict(SETTINGS), 'results': {}}), [])
+
+    def test_different_settings(self):
+        baseline = {'settings': dict(SETTINGS, restaurants=20, server=True)}
+        self.assertEqual(settings_mismatch(SETTINGS, baseline),
+                         [('restaurants', 20, 200), ('server', True, False)])
+
+    def test_concurrency_without_server(self):
+        baseline = {'settings': dict(SETTINGS, concurrency=16)}
+        self.assertEqual(settings_mismatch(SETTINGS, baseline), [])
+        server = dict(SETTINGS, server=True)
+        baseline = {'settings': dict(server, concurrency=16)}
+        self.assertEqual(settings_mismatch(server, baseline),
+                         [('concurrency', 16, 4)])
+
+    def test_baseline_without_settings(self):
+        self.assertEqual(len(settings_mismatch(SETTINGS, {'menu': {}})),
+                         len(SETTINGS) - 1)
+
+    def test_compare(self):
+        baseline = {'results': {'menu': {'p50_ms': 10.0, 'p95_ms': 20.0}}}
+        rows = compare({'menu': {'p50_ms': 12.0, 'p95_ms': 20.0}}, baseline)
+        self.assertEqual(rows, [('menu', 'p50_ms', 10.0, 12.0, 20.0, True),
+                                ('menu', 'p95_ms', 20.0, 20.0, 0.0, False)])
@@ -0,0 +1,93 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, User, Restaurant, MenuItem, MenuDocument
+
+
+class BulkMenuItemsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        admin = User(email='admin@example.com', username='admin',
+                     password='secret', confirmed=True,
+                     role=Role.query.filter_by(name='Administrator').first())
+        restaurant = Restaurant(name='First')
+        db.session.add_all([admin, restaurant])
+        db.session.flush()
+        item = MenuItem(name='Soup', course='Appetizer', price='$3',
+                        restaurant_id=restaurant.id)
+        db.session.add(item)
+        db.session.commit()
+        self.restaurant_id, self.item_id = restaurant.id, item.id
+        self.client.post('/auth/login', data={
+            'email': 'admin@example.com', 'password': 'secret'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def send(self, rows, method='POST'):
+        response = self.client.open(
+            '/restaurant/%d/menu/bulk' % self.restaurant_id, method=method,
+            data=json.dumps(rows), content_type='application/json')
+        return response.status_code, json.loads(response.data.decode('utf-8'))
+
+    def test_create(self):
+        status, data = self.send([{'name': 'Stew', 'price': '$4.50',
+                                   'course': 'Main'}, {'name': 'Tea'}])
+        self.assertEqual(status, 200)
+        self.assertEqual(data['created'], 2)
+        stew = db.session.query(MenuItem).get(data['results'][0]['id'])
+        self.assertEqual((stew.name, stew.price_cents, stew.course_key),
+                         ('Stew', 450, 'main'))
+        document = db.session.query(MenuDocument).get(self.restaurant_id)
+        self.assertIn(b'Stew', document.json_body)
+
+    def test_update_needs_put(self):
+        status, data = self.send([{'id': self.item_id, 'name': 'Stew'}])
+        self.assertEqual(status, 400)
+        status, data = self.send([{'id': self.item_id, 'name': 'Stew'}],
+                                 'PUT')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['updated'], 1)
+        db.session.expire_all()
+        item = db.session.query(MenuItem).get(self.item_id)
+        self.assertEqual((item.name, item.version), ('Stew', 2))
+
+    def test_invalid_rows_are_reported_per_row(self):
+        status, data = self.send([{'name': 'Stew'}, {'name': 'x' * 81},
+                                  {'id': 10 ** 30, 'name': 'Huge'},
+                                  {'id': 999, 'name': 'Missing'}], 'PUT')
+        self.assertEqual(status, 207)
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['created', 'error', 'error', 'error'])
+        self.assertEqual(data['results'][2]['error'], 'id is out of range')
+        self.assertEqual(data['results'][3]['error'], 'menu item not found')
+
+    def test_item_of_other_restaurant_is_not_updated(self):
+        other = Restaurant(name='Second')
+        db.session.add(other)
+        db.session.commit()
+        response = self.client.put(
+            '/restaurant/%d/menu/bulk' % other.id,
+            data=json.dumps([{'id': self.item_id, 'name': 'Stew'}]),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        db.session.expire_all()
+        self.assertEqual(db.session.query(MenuItem).get(self.item_id).name,
+                         'Soup')
+
+    def test_anonymous_is_rejected(self):
+        self.client.get('/auth/logout')
+        response = self.client.post(
+            '/restaurant/%d/menu/bulk' % self.restaurant_id,
+            data=json.dumps([{'name': 'Stew'}]),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(MenuItem.query.filter_by(name='Stew').first())
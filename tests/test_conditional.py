@@ -0,0 +1,90 @@
+import unittest
+from datetime import timedelta
+
+from werkzeug.http import http_date
+
+from app import create_app, db
+from app.models import Role, Restaurant, MenuItem
+
+
+class ConditionalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        restaurant = Restaurant(name='First')
+        db.session.add(restaurant)
+        db.session.flush()
+        item = MenuItem(name='Soup', course='Appetizer', price='$3.00',
+                        restaurant_id=restaurant.id)
+        db.session.add(item)
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        self.restaurant_id, self.item_id = restaurant.id, item.id
+        self.urls = ['/restaurants/JSON',
+                     '/restaurant/%d/menu/JSON' % self.restaurant_id,
+                     '/restaurant/%d/menu/JSON?sort=price' % self.restaurant_id,
+                     '/restaurant/%d/menu/%d/JSON' % (self.restaurant_id,
+                                                      self.item_id)]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_if_none_match(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            etag = response.headers['ETag']
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+            response = self.client.get(url, headers={
+                'If-None-Match': '"other", %s' % etag})
+            self.assertEqual(response.status_code, 304, url)
+            response = self.client.get(url, headers={'If-None-Match': '*'})
+            self.assertEqual(response.status_code, 304, url)
+            response = self.client.get(url, headers={
+                'If-None-Match': '"other"'})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_if_modified_since(self):
+        url = '/restaurant/%d/menu/JSON' % self.restaurant_id
+        response = self.client.get(url)
+        last_modified = response.last_modified
+        self.assertIsNotNone(last_modified)
+        response = self.client.get(url, headers={
+            'If-Modified-Since': http_date(last_modified)})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, headers={
+            'If-Modified-Since': http_date(last_modified - timedelta(1))})
+        self.assertEqual(response.status_code, 200)
+        # If-None-Match wins over If-Modified-Since
+        response = self.client.get(url, headers={
+            'If-Modified-Since': http_date(last_modified),
+            'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_changes_validators(self):
+        etags = [self.client.get(url).headers['ETag'] for url in self.urls]
+        self.client.post('/restaurant/%d/menu/%d/edit/'
+                         % (self.restaurant_id, self.item_id),
+                         data={'menu_item_name': 'Stew'})
+        for url, etag in zip(self.urls[1:], etags[1:]):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(b'Stew', response.data)
+
+    def test_restaurant_rename_changes_listing(self):
+        url = self.urls[0]
+        etag = self.client.get(url).headers['ETag']
+        self.client.post('/restaurant/%d/edit/' % self.restaurant_id,
+                         data={'edit': 'Renamed'})
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Renamed', response.data)
@@ -0,0 +1,53 @@
+import unittest
+
+from app import create_app, db
+from app.menus import group_by_course, menu_query
+from app.models import Role, Restaurant, MenuItem, normalize_course
+
+
+class CourseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        restaurant = Restaurant(name='First')
+        db.session.add(restaurant)
+        db.session.flush()
+        for name, course in (('Tea', 'Beverage'), ('Cake', 'Dessert'),
+                             ('Soup', ' appetizer '), ('Fries', 'Sides'),
+                             ('Salad', 'Appetizer'), ('Olives', 'Bar snacks'),
+                             ('Bread', None)):
+            db.session.add(MenuItem(name=name, course=course, price='$1',
+                                    restaurant_id=restaurant.id))
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        self.restaurant_id = restaurant.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_normalize_course(self):
+        self.assertEqual(normalize_course(' Appetizer '), 'appetizer')
+        self.assertEqual(normalize_course(None), '')
+
+    def test_group_by_course(self):
+        courses = group_by_course(menu_query(self.restaurant_id))
+        self.assertEqual([course.label for course in courses],
+                         ['Appetizers', 'Desserts', 'Beverages', 'Other',
+                          'Bar snacks', 'Sides'])
+        self.assertEqual([item.name for item in courses[0].items],
+                         ['Soup', 'Salad'])
+
+    def test_menu_page(self):
+        response = self.client.get('/restaurant/%d/menu/' % self.restaurant_id)
+        self.assertEqual(response.status_code, 200)
+        body = response.data.decode('utf-8')
+        positions = [body.index('>%s<' % name) for name in
+                     ('Soup', 'Salad', 'Cake', 'Tea', 'Bread', 'Olives',
+                      'Fries')]
+        self.assertEqual(positions, sorted(positions))
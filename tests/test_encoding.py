@@ -0,0 +1,94 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from app import create_app, db, encoding
+from app.models import Role, Restaurant
+
+
+class EncodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['COMPRESS_MIN_SIZE'] = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        db.session.add_all([Restaurant(name='Restaurant %d' % i)
+                            for i in range(3)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, **headers):
+        response = self.client.get('/restaurants/JSON', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response.headers['Vary'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        return response
+
+    def names(self, data):
+        return [restaurant['name'] for restaurant in data['restaurants']]
+
+    def test_identity(self):
+        response = self.get()
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(len(self.names(json.loads(
+            response.data.decode('utf-8')))), 3)
+
+    def test_gzip(self):
+        response = self.get(**{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.data).decode('utf-8'))
+        self.assertEqual(len(self.names(data)), 3)
+
+    def test_deflate(self):
+        response = self.get(**{'Accept-Encoding': 'deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        data = json.loads(zlib.decompress(response.data).decode('utf-8'))
+        self.assertEqual(len(self.names(data)), 3)
+
+    def test_preferred_coding(self):
+        response = self.get(**{'Accept-Encoding': 'deflate;q=0.5, gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_small_body_is_not_compressed(self):
+        self.app.config['COMPRESS_MIN_SIZE'] = 1 << 20
+        response = self.get(**{'Accept-Encoding': 'gzip'})
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        json.loads(response.data.decode('utf-8'))
+
+    def test_variants_have_distinct_etags(self):
+        plain = self.get()
+        compressed = self.get(**{'Accept-Encoding': 'gzip'})
+        self.assertNotEqual(plain.headers['ETag'],
+                            compressed.headers['ETag'])
+        response = self.client.get('/restaurants/JSON', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': compressed.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    @unittest.skipIf(encoding.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.get(Accept='application/msgpack')
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        data = encoding.msgpack.unpackb(response.data, raw=False)
+        self.assertEqual(self.names(data), self.names(json.loads(
+            self.get().data.decode('utf-8'))))
+
+    def test_json_is_preferred(self):
+        response = self.get(Accept='application/json, application/msgpack')
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_brotli_quality(self):
+        self.assertEqual(encoding.brotli_quality(6), 5)
+        self.assertEqual(encoding.brotli_quality(-1), 5)
+        self.assertEqual(encoding.brotli_quality(9), 6)
+        self.assertEqual(encoding.brotli_quality(1), 0)
+        self.assertEqual(encoding.brotli_quality(0), 0)
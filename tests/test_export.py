@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import unittest
+
+from app import create_app, db
+from app.export import catalog_ndjson
+from app.models import Role, Restaurant, MenuItem
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        first = Restaurant(name='First')
+        empty = Restaurant(name='Empty')
+        last = Restaurant(name='Last')
+        db.session.add_all([first, empty, last])
+        db.session.flush()
+        db.session.add_all([
+            MenuItem(name='Soup', course='Appetizer', price='$3.00',
+                     restaurant_id=first.id),
+            MenuItem(name='Stew', course='Entree', price='$9.00',
+                     restaurant_id=first.id),
+            MenuItem(name='Cake', course='Dessert', price='$4.00',
+                     restaurant_id=last.id),
+        ])
+        db.session.commit()
+        self.first_id, self.empty_id, self.last_id = \
+            first.id, empty.id, last.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def lines(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.mimetype, response.data.decode('utf-8')
+
+    def test_catalog(self):
+        mimetype, body = self.lines('/catalog/export.ndjson')
+        self.assertEqual(mimetype, 'application/x-ndjson')
+        restaurants = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([r['id'] for r in restaurants],
+                         [self.first_id, self.empty_id, self.last_id])
+        self.assertEqual([[item['name'] for item in r['menu_items']]
+                          for r in restaurants],
+                         [['Soup', 'Stew'], [], ['Cake']])
+
+    def test_catalog_chunks(self):
+        from app import export
+        chunk_size, export.CHUNK_SIZE = export.CHUNK_SIZE, 1
+        try:
+            lines = list(catalog_ndjson())
+        finally:
+            export.CHUNK_SIZE = chunk_size
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(json.loads(lines[0])['menu_items']), 2)
+
+    def test_empty_catalog(self):
+        db.session.query(MenuItem).delete()
+        db.session.query(Restaurant).delete()
+        db.session.commit()
+        self.assertEqual(self.lines('/catalog/export.ndjson')[1], '')
+
+    def test_menu_ndjson(self):
+        mimetype, body = self.lines(
+            '/restaurant/%d/menu/export.ndjson' % self.first_id)
+        self.assertEqual(mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['name']
+                          for line in body.splitlines()], ['Soup', 'Stew'])
+
+    def test_menu_csv(self):
+        mimetype, body = self.lines(
+            '/restaurant/%d/menu/export.csv' % self.first_id)
+        self.assertEqual(mimetype, 'text/csv')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], ['id', 'name', 'description', 'price',
+                                   'course'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Soup', 'Stew'])
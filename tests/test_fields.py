@@ -0,0 +1,99 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, Restaurant, MenuItem
+
+
+class FieldsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        first = Restaurant(name='First')
+        second = Restaurant(name='Second')
+        db.session.add_all([first, second])
+        db.session.flush()
+        db.session.add_all([
+            MenuItem(name='Cake', course='Dessert', price='$4.00',
+                     restaurant_id=first.id),
+            MenuItem(name='Soup', course='Appetizer', price='$3.00',
+                     restaurant_id=first.id),
+        ])
+        Restaurant.touch_menu(first.id)
+        db.session.commit()
+        self.first_id, self.second_id = first.id, second.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status, url)
+        if status == 200:
+            return json.loads(response.data.decode('utf-8'))
+
+    def test_restaurant_fields(self):
+        data = self.get('/restaurants/JSON?fields=name')
+        self.assertEqual(data['restaurants'][0], {'id': self.first_id,
+                                                  'name': 'First'})
+        data = self.get('/restaurants/JSON?fields=id')
+        self.assertEqual(data['restaurants'][0], {'id': self.first_id})
+
+    def test_include_menu_items(self):
+        data = self.get('/restaurants/JSON')
+        self.assertNotIn('menu_items', data['restaurants'][0])
+        data = self.get('/restaurants/JSON?include=menu_items')
+        first, second = data['restaurants']
+        self.assertEqual(second['menu_items'], [])
+        menu = self.get('/restaurant/%d/menu/JSON' % self.first_id)
+        # same order as the menu document
+        self.assertEqual([item['name'] for item in first['menu_items']],
+                         [item['name'] for item in menu['menu_items']])
+
+    def test_included_item_fields(self):
+        data = self.get('/restaurants/JSON?include=menu_items'
+                        '&fields[menu_items]=price')
+        for item in data['restaurants'][0]['menu_items']:
+            self.assertEqual(set(item), {'id', 'price'})
+
+    def test_menu_fields(self):
+        data = self.get('/restaurant/%d/menu/JSON?fields=name,course'
+                        % self.first_id)
+        for item in data['menu_items']:
+            self.assertEqual(set(item), {'id', 'name', 'course'})
+        data = self.get('/menus/JSON?ids=%d&fields=name' % self.first_id)
+        for item in data['menus'][str(self.first_id)]:
+            self.assertEqual(set(item), {'id', 'name'})
+
+    def test_unknown_names(self):
+        for url in ('/restaurants/JSON?fields=password',
+                    '/restaurants/JSON?include=users',
+                    '/restaurants/JSON?include=menu_items'
+                    '&fields[menu_items]=secret',
+                    '/restaurant/%d/menu/JSON?fields=nope' % self.first_id):
+            self.get(url, 400)
+
+    def test_etag_depends_on_projection(self):
+        etags = {self.client.get(url).headers['ETag'] for url in (
+            '/restaurants/JSON', '/restaurants/JSON?fields=id',
+            '/restaurants/JSON?include=menu_items')}
+        self.assertEqual(len(etags), 3)
+
+    def test_included_items_change_etag(self):
+        url = '/restaurants/JSON?include=menu_items'
+        etag = self.client.get(url).headers['ETag']
+        db.session.add(MenuItem(name='Stew', course='Entree', price='$9.00',
+                                restaurant_id=self.second_id))
+        Restaurant.touch_menu(self.second_id)
+        db.session.commit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item['name'] for item in
+                          data['restaurants'][1]['menu_items']], ['Stew'])
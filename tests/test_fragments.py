@@ -0,0 +1,52 @@
+import unittest
+
+from app import create_app, db, fragment_cache
+from app.cache import LRUCache
+from app.models import Role, Restaurant, MenuItem
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        fragment_cache.backend = LRUCache(maxsize=100, ttl=3600)
+        self.client = self.app.test_client()
+        restaurant = Restaurant(name='First')
+        db.session.add(restaurant)
+        db.session.flush()
+        item = MenuItem(name='Soup', course='Appetizer', price='$1',
+                        restaurant_id=restaurant.id)
+        db.session.add(item)
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        self.restaurant_id, self.item_id = restaurant.id, item.id
+
+    def tearDown(self):
+        fragment_cache.init_app(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def menu_page(self):
+        return self.client.get('/restaurant/%d/menu/' % self.restaurant_id) \
+            .get_data(as_text=True)
+
+    def test_write_in_another_worker_is_not_served(self):
+        self.assertIn('Soup', self.menu_page())
+        # written without invalidating anything, as another worker would
+        db.session.query(MenuItem).filter_by(id=self.item_id).update(
+            MenuItem.changes({MenuItem.name: 'Stew'}))
+        Restaurant.touch_menu(self.restaurant_id)
+        db.session.commit()
+        page = self.menu_page()
+        self.assertIn('Stew', page)
+        self.assertNotIn('Soup', page)
+
+    def test_unchanged_fragment_is_reused(self):
+        self.menu_page()
+        hits = fragment_cache.backend.stats.hits
+        self.menu_page()
+        self.assertGreater(fragment_cache.backend.stats.hits, hits)
@@ -0,0 +1,106 @@
+import json
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+from app import create_app, db, mail, mail_queue
+from app.models import Role, OutboxMessage
+
+
+class MailQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['MAIL_QUEUE_WORKERS'] = 1
+        mail_queue.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        mail_queue.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def message(self):
+        return Message('Hello', sender='menu@example.com',
+                       recipients=['a@example.com', 'b,c@example.com'],
+                       body='hello')
+
+    def outbox(self, **values):
+        values.setdefault('next_attempt_at',
+                          datetime.utcnow() - timedelta(seconds=1))
+        message = OutboxMessage(subject='Hello', sender='menu@example.com',
+                                recipients='["a@example.com"]', body='hello',
+                                **values)
+        db.session.add(message)
+        db.session.commit()
+        return message.id
+
+    def fail_connect(self):
+        def connect():
+            raise IOError('connection refused')
+        mail.connect = connect
+        self.addCleanup(delattr, mail, 'connect')
+
+    def test_enqueue_joins_the_transaction(self):
+        mail_queue.enqueue(self.message())
+        db.session.rollback()
+        self.assertEqual(OutboxMessage.query.count(), 0)
+
+    def test_worker_delivers_after_commit(self):
+        mail_queue.enqueue(self.message())
+        db.session.commit()
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.recipient_list,
+                         ['a@example.com', 'b,c@example.com'])
+        self.assertEqual(json.loads(message.recipients),
+                         message.recipient_list)
+        deadline = time.time() + 5
+        while message.status != OutboxMessage.SENT and time.time() < deadline:
+            time.sleep(0.01)
+            db.session.expire_all()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertIsNotNone(message.sent_at)
+
+    def test_comma_separated_recipients_of_old_rows(self):
+        message = OutboxMessage(recipients='a@example.com,b@example.com')
+        self.assertEqual(message.recipient_list,
+                         ['a@example.com', 'b@example.com'])
+
+    def test_retry_backs_off_exponentially(self):
+        self.fail_connect()
+        message_id = self.outbox()
+        for attempt, delay in ((1, 30), (2, 60), (3, 120)):
+            before = datetime.utcnow()
+            self.assertEqual(mail_queue.process_batch(), 1)
+            message = db.session.query(OutboxMessage).get(message_id)
+            self.assertEqual((message.status, message.attempts),
+                             (OutboxMessage.PENDING, attempt))
+            self.assertEqual(message.last_error, 'connection refused')
+            wait = (message.next_attempt_at - before).total_seconds()
+            self.assertTrue(delay - 1 <= wait <= delay + 1, wait)
+            # not due yet
+            self.assertEqual(mail_queue.process_batch(), 0)
+            message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+    def test_gives_up_after_max_attempts(self):
+        self.fail_connect()
+        message_id = self.outbox(
+            attempts=self.app.config['MAIL_QUEUE_MAX_ATTEMPTS'] - 1)
+        self.assertEqual(mail_queue.process_batch(), 1)
+        message = db.session.query(OutboxMessage).get(message_id)
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+        self.assertEqual(mail_queue.process_batch(), 0)
+
+    def test_stale_claim_is_released(self):
+        message_id = self.outbox(
+            status=OutboxMessage.SENDING, claim='dead',
+            claimed_at=datetime.utcnow() - timedelta(hours=1))
+        self.assertEqual(mail_queue.process_batch(), 1)
+        message = db.session.query(OutboxMessage).get(message_id)
+        self.assertEqual(message.status, OutboxMessage.SENT)
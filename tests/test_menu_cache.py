@@ -0,0 +1,61 @@
+import unittest
+
+from app import create_app, db, menu_cache
+from app.cache import LRUCache
+from app.menus import get_menu
+from app.models import Role, Restaurant, MenuItem
+
+
+class MenuCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        menu_cache.backend = LRUCache(maxsize=16, ttl=300)
+        restaurant = Restaurant(name='First')
+        db.session.add(restaurant)
+        db.session.flush()
+        db.session.add(MenuItem(name='Soup', course='Appetizer', price='$1',
+                                restaurant_id=restaurant.id))
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        self.restaurant_id = restaurant.id
+
+    def tearDown(self):
+        menu_cache.init_app(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def names(self, menu):
+        return [item['name'] for course in menu['courses']
+                for item in course.items]
+
+    def test_cached_menu_is_reused(self):
+        get_menu(self.restaurant_id)
+        get_menu(self.restaurant_id)
+        self.assertEqual(menu_cache.backend.stats.hits, 1)
+
+    def test_changed_version_reloads_without_invalidate(self):
+        self.assertEqual(self.names(get_menu(self.restaurant_id)), ['Soup'])
+        # a write in another worker does not invalidate this cache
+        db.session.add(MenuItem(name='Cake', course='Dessert', price='$2',
+                                restaurant_id=self.restaurant_id))
+        Restaurant.touch_menu(self.restaurant_id)
+        db.session.commit()
+        self.assertEqual(self.names(get_menu(self.restaurant_id)),
+                         ['Soup', 'Cake'])
+
+    def test_deleted_restaurant_is_not_served(self):
+        get_menu(self.restaurant_id)
+        # deleted by another worker, its cached menu stays behind
+        db.session.query(Restaurant).filter_by(id=self.restaurant_id).delete()
+        db.session.commit()
+        restaurant = Restaurant(name='Second')
+        db.session.add(restaurant)
+        db.session.commit()
+        self.assertNotEqual(restaurant.id, self.restaurant_id)
+        self.assertEqual(get_menu(self.restaurant_id)['courses'], [])
+        self.assertEqual(get_menu(restaurant.id)['courses'], [])
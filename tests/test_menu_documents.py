@@ -0,0 +1,108 @@
+import gzip
+import json
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Role, User, Restaurant, MenuItem, MenuDocument
+
+
+class MenuDocumentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login_admin(self):
+        admin = User(email='admin@example.com', username='admin',
+                     password='secret', confirmed=True,
+                     role=Role.query.filter_by(name='Administrator').first())
+        db.session.add(admin)
+        db.session.commit()
+        response = self.client.post('/auth/login', data={
+            'email': 'admin@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+
+    def statements(self):
+        executed = []
+
+        def record(conn, cursor, statement, *args):
+            executed.append(statement.split(None, 1)[0].upper())
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute',
+                        record)
+        return executed
+
+    def test_create_restaurant_writes_document(self):
+        self.login_admin()
+        response = self.client.post('/restaurant/new/',
+                                    data={'restaurant_name': 'New'})
+        self.assertEqual(response.status_code, 302)
+        restaurant = Restaurant.query.filter_by(name='New').one()
+        document = MenuDocument.query.get(restaurant.id)
+        self.assertIsNotNone(document)
+        self.assertEqual(json.loads(document.json_body.decode('utf-8')),
+                         {'menu_items': []})
+
+    def test_unknown_restaurant_does_not_write(self):
+        executed = self.statements()
+        response = self.client.get('/restaurant/99999/menu/JSON')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8')),
+                         {'menu_items': []})
+        self.assertFalse(set(executed) & {'INSERT', 'UPDATE', 'DELETE'})
+
+    def test_restaurant_without_document_does_not_write(self):
+        # rows written without the orm, as by old code, have no document
+        db.session.execute(Restaurant.__table__.insert(),
+                           {'id': 1, 'name': 'Old'})
+        db.session.execute(MenuItem.__table__.insert(), MenuItem.row({
+            'name': 'Soup', 'course': 'Appetizer', 'price': '$3.00',
+            'description': None, 'restaurant_id': 1}))
+        db.session.commit()
+        executed = self.statements()
+        response = self.client.get('/restaurant/1/menu/JSON')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item['name'] for item in data['menu_items']],
+                         ['Soup'])
+        self.assertFalse(set(executed) & {'INSERT', 'UPDATE', 'DELETE'})
+        self.assertIsNone(MenuDocument.query.get(1))
+
+    def test_small_menu_is_not_gzipped(self):
+        restaurant = Restaurant(name='Empty')
+        db.session.add(restaurant)
+        db.session.flush()
+        MenuDocument.mark_stale(db.session(), restaurant.id)
+        db.session.commit()
+        response = self.client.get(
+            '/restaurant/%d/menu/JSON' % restaurant.id,
+            headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'{"menu_items":[]}')
+
+    def test_large_menu_is_gzipped(self):
+        restaurant = Restaurant(name='Large')
+        db.session.add(restaurant)
+        db.session.flush()
+        for i in range(50):
+            db.session.add(MenuItem(name='Dish %d' % i, course='Main',
+                                    price='$1', description='x' * 50,
+                                    restaurant_id=restaurant.id))
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        response = self.client.get(
+            '/restaurant/%d/menu/JSON' % restaurant.id,
+            headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        data = json.loads(gzip.decompress(response.data).decode('utf-8'))
+        self.assertEqual(len(data['menu_items']), 50)
@@ -0,0 +1,133 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, Restaurant, MenuItem, MenuDocument
+
+
+class MenuItemViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        first = Restaurant(name='First')
+        second = Restaurant(name='Second')
+        db.session.add_all([first, second])
+        db.session.commit()
+        self.first_id, self.second_id = first.id, second.id
+        item = MenuItem(name='Soup', course='Appetizer', price='$3.00',
+                        restaurant_id=self.first_id)
+        db.session.add(item)
+        Restaurant.touch_menu(self.first_id)
+        db.session.commit()
+        self.item_id = item.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def menu_version(self, restaurant_id):
+        return db.session.query(Restaurant.menu_version) \
+            .filter_by(id=restaurant_id).scalar()
+
+    def document_names(self, restaurant_id):
+        body = db.session.query(MenuDocument.json_body) \
+            .filter_by(restaurant_id=restaurant_id).scalar()
+        return [item['name'] for item in
+                json.loads(body.decode('utf-8'))['menu_items']]
+
+    def test_edit_item_of_other_restaurant(self):
+        versions = (self.menu_version(self.first_id),
+                    self.menu_version(self.second_id))
+        response = self.client.post(
+            '/restaurant/%d/menu/%d/edit/' % (self.second_id, self.item_id),
+            data={'menu_item_name': 'Stew'})
+        self.assertEqual(response.status_code, 404)
+        db.session.expire_all()
+        self.assertEqual(db.session.query(MenuItem).get(self.item_id).name,
+                         'Soup')
+        self.assertEqual((self.menu_version(self.first_id),
+                          self.menu_version(self.second_id)), versions)
+
+    def test_delete_item_of_other_restaurant(self):
+        response = self.client.post(
+            '/restaurant/%d/menu/%d/delete/' % (self.second_id, self.item_id))
+        self.assertEqual(response.status_code, 404)
+        db.session.expire_all()
+        self.assertIsNotNone(db.session.query(MenuItem).get(self.item_id))
+
+    def test_edit_item_updates_menu_document(self):
+        version = self.menu_version(self.first_id)
+        response = self.client.post(
+            '/restaurant/%d/menu/%d/edit/' % (self.first_id, self.item_id),
+            data={'menu_item_name': 'Stew'})
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual(self.menu_version(self.first_id), version + 1)
+        self.assertEqual(self.document_names(self.first_id), ['Stew'])
+
+    def test_delete_item_updates_menu_document(self):
+        response = self.client.post(
+            '/restaurant/%d/menu/%d/delete/' % (self.first_id, self.item_id))
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual(self.document_names(self.first_id), [])
+
+    def test_deleted_item_id_is_not_reused(self):
+        url = '/restaurant/%d/menu/%d/JSON' % (self.first_id, self.item_id)
+        etag = self.client.get(url).headers['ETag']
+        self.client.post('/restaurant/%d/menu/%d/delete/'
+                         % (self.first_id, self.item_id))
+        self.client.post('/restaurant/%d/menu/new/' % self.first_id, data={
+            'menu_item_name': 'Stew', 'menu_item_course': 'Main',
+            'menu_item_price': '$4.00', 'menu_item_description': ''})
+        new_id = db.session.query(MenuItem.id).filter_by(name='Stew').scalar()
+        self.assertNotEqual(new_id, self.item_id)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertNotEqual(response.status_code, 304)
+
+    def test_deleted_restaurant_id_is_not_reused(self):
+        url = '/restaurant/%d/menu/JSON' % self.second_id
+        etag = self.client.get(url).headers['ETag']
+        db.session.query(Restaurant).filter_by(id=self.second_id).delete()
+        db.session.commit()
+        restaurant = Restaurant(name='Third')
+        db.session.add(restaurant)
+        db.session.commit()
+        self.assertNotEqual(restaurant.id, self.second_id)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertNotEqual(response.status_code, 304)
+
+    def test_bulk_insert_does_not_reuse_deleted_id(self):
+        from app.bulk import upsert_menu_items
+        self.client.post('/restaurant/%d/menu/%d/delete/'
+                         % (self.first_id, self.item_id))
+        results = upsert_menu_items(self.first_id, [{'name': 'Stew'}])
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertGreater(results[0]['id'], self.item_id)
+
+    def test_create_item_for_missing_restaurant(self):
+        for method in (self.client.get, self.client.post):
+            response = method('/restaurant/%d/menu/new/' % (self.second_id + 1),
+                              data={'menu_item_name': 'Stew',
+                                    'menu_item_course': 'Main',
+                                    'menu_item_price': '$4.00',
+                                    'menu_item_description': ''})
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(db.session.query(MenuItem)
+                         .filter_by(name='Stew').count(), 0)
+
+    def test_restaurant_delete_cascades(self):
+        self.assertEqual(db.session.query(MenuDocument)
+                         .filter_by(restaurant_id=self.first_id).count(), 1)
+        # a plain row delete, only the foreign keys remove the children
+        db.session.query(Restaurant).filter_by(id=self.first_id).delete()
+        db.session.commit()
+        self.assertEqual(db.session.query(MenuItem)
+                         .filter_by(restaurant_id=self.first_id).count(), 0)
+        self.assertEqual(db.session.query(MenuDocument)
+                         .filter_by(restaurant_id=self.first_id).count(), 0)
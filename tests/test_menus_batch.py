@@ -0,0 +1,72 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, Restaurant, MenuItem
+
+
+class MenusBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['MENUS_BATCH_MAX'] = 5
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        restaurant = Restaurant(name='First')
+        db.session.add(restaurant)
+        db.session.flush()
+        for name, course in (('Tea', 'Beverage'), ('Cake', 'Dessert'),
+                             ('Soup', 'Appetizer'), ('Steak', 'Entree')):
+            db.session.add(MenuItem(name=name, course=course, price='$1',
+                                    restaurant_id=restaurant.id))
+        Restaurant.touch_menu(restaurant.id)
+        db.session.commit()
+        self.restaurant_id = restaurant.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_ids(self, ids):
+        return self.client.post('/menus/JSON', data=json.dumps({'ids': ids}),
+                                content_type='application/json')
+
+    def test_menus_and_missing(self):
+        response = self.client.get('/menus/JSON?ids=%d,999,%d'
+                                   % (self.restaurant_id, self.restaurant_id))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(list(data['menus']), [str(self.restaurant_id)])
+        self.assertEqual(data['missing'], [999])
+
+    def test_same_course_order_as_menu_json(self):
+        batch = json.loads(self.client.get(
+            '/menus/JSON?ids=%d' % self.restaurant_id).data.decode('utf-8'))
+        menu = json.loads(self.client.get(
+            '/restaurant/%d/menu/JSON' % self.restaurant_id)
+            .data.decode('utf-8'))
+        names = [item['name'] for item in
+                 batch['menus'][str(self.restaurant_id)]['menu_items']]
+        self.assertEqual(names, ['Soup', 'Steak', 'Cake', 'Tea'])
+        self.assertEqual(names,
+                         [item['name'] for item in menu['menu_items']])
+
+    def test_limit_checked_before_parsing(self):
+        self.assertEqual(self.post_ids([1] * 6).status_code, 413)
+        self.assertEqual(self.post_ids(['x'] * 6).status_code, 413)
+
+    def test_non_integer_ids(self):
+        for ids in ([True], [1.7], [None], ['1.5'], [[1]]):
+            self.assertEqual(self.post_ids(ids).status_code, 400, ids)
+        self.assertEqual(self.post_ids([self.restaurant_id, '2']).status_code,
+                         200)
+
+    def test_unicode_digits_and_huge_ids(self):
+        for query in ('%C2%B2', '99999999999999999999999', '-1'):
+            response = self.client.get('/menus/JSON?ids=' + query)
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.post_ids([10 ** 30]).status_code, 400)
+        self.assertEqual(self.post_ids([2 ** 63 - 1]).status_code, 200)
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db, metrics
+from app.models import Role
+
+
+class SlowQueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['METRICS_ENABLED'] = True
+        self.profile_dir = tempfile.mkdtemp()
+        self.app.config['METRICS_PROFILE_DIR'] = self.profile_dir
+        metrics.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_anonymous_is_forbidden(self):
+        response = self.client.get('/metrics/slow_queries')
+        self.assertEqual(response.status_code, 403)
+
+    def test_failing_request_is_recorded(self):
+        def boom():
+            raise RuntimeError('boom')
+        self.app.add_url_rule('/boom', 'boom', boom)
+        self.app.config['METRICS_PROFILE_RATE'] = 1.0
+        # tear the request down right away, as outside of tests
+        self.app.config['PRESERVE_CONTEXT_ON_EXCEPTION'] = False
+        with self.assertRaises(RuntimeError):
+            self.client.get('/boom')
+        self.assertIn('menu_request_duration_seconds_count{endpoint="boom"} 1',
+                      metrics.requests.render())
+        # the profiler was stopped and written by the teardown
+        self.assertTrue(any(name.startswith('boom-')
+                            for name in os.listdir(self.profile_dir)))
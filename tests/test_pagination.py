@@ -0,0 +1,56 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, Restaurant
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['RESTAURANTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        restaurants = [Restaurant(name='Restaurant %d' % i) for i in range(5)]
+        db.session.add_all(restaurants)
+        db.session.commit()
+        self.ids = [restaurant.id for restaurant in restaurants]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def page(self, query=''):
+        response = self.client.get('/restaurants/JSON' + query)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))
+
+    def ids_of(self, page):
+        return [restaurant['id'] for restaurant in page['restaurants']]
+
+    def test_walk_forward_and_back(self):
+        first = self.page()
+        self.assertEqual(self.ids_of(first), self.ids[:2])
+        self.assertIsNone(first['prev'])
+        second = self.page('?after=%d' % first['next'])
+        self.assertEqual(self.ids_of(second), self.ids[2:4])
+        last = self.page('?after=%d' % second['next'])
+        self.assertEqual(self.ids_of(last), self.ids[4:])
+        self.assertIsNone(last['next'])
+        back = self.page('?before=%d' % last['prev'])
+        self.assertEqual(self.ids_of(back), self.ids[2:4])
+
+    def test_per_page_is_capped(self):
+        self.app.config['MAX_PER_PAGE'] = 3
+        self.assertEqual(len(self.ids_of(self.page('?per_page=100'))), 3)
+
+    def test_invalid_arguments(self):
+        for query in ('?after=99999999999999999999999',
+                      '?before=-99999999999999999999999',
+                      '?per_page=-1', '?per_page=0'):
+            response = self.client.get('/restaurants/JSON' + query)
+            self.assertEqual(response.status_code, 400, query)
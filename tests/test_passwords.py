@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+
+from app import create_app, db, password_hasher, login_throttle
+from app.models import Role, User
+from app.passwords import LoginThrottled, PasswordHasher
+
+
+class HashingBusyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        # every slot of the hashing pool is in use
+        password_hasher.workers = 1
+        password_hasher.timeout = 0.01
+        password_hasher._slots = threading.BoundedSemaphore(1)
+        password_hasher._slots.acquire()
+
+    def tearDown(self):
+        password_hasher.init_app(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_register_answers_503(self):
+        response = self.client.post('/auth/register', data={
+            'username': 'someone', 'email': 'someone@example.com',
+            'password': 'secret', 'confirm_password': 'secret'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIsNone(User.query.filter_by(username='someone').first())
+
+
+class LoginThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        db.session.add(User(email='user@example.com', username='user',
+                            password='secret', confirmed=True))
+        db.session.commit()
+        login_throttle.init_app(self.app)
+        login_throttle._failures.clear()
+
+    def tearDown(self):
+        login_throttle._failures.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, password, address='10.0.0.1'):
+        return self.client.post('/auth/login', data={
+            'email': 'user@example.com', 'password': password},
+            environ_base={'REMOTE_ADDR': address})
+
+    def test_account_is_locked_for_the_failing_address(self):
+        for i in range(5):
+            self.assertEqual(self.login('wrong').status_code, 200)
+        self.assertEqual(self.login('secret').status_code, 429)
+
+    def test_other_addresses_can_still_log_in(self):
+        for i in range(5):
+            self.login('wrong', '10.0.0.1')
+        self.assertEqual(self.login('secret', '10.0.0.2').status_code, 302)
+
+    def test_window_expires(self):
+        login_throttle.window = 0.05
+        keys = login_throttle.keys('user@example.com', '10.0.0.1')
+        for i in range(5):
+            login_throttle.failed(keys)
+        with self.assertRaises(LoginThrottled):
+            login_throttle.check(keys)
+        time.sleep(0.1)
+        login_throttle.check(keys)
+
+    def test_success_resets_the_account(self):
+        for i in range(4):
+            self.login('wrong')
+        self.assertEqual(self.login('secret').status_code, 302)
+        self.client.get('/auth/logout')
+        for i in range(4):
+            self.login('wrong')
+        self.assertEqual(self.login('secret').status_code, 302)
+
+    def test_address_limit(self):
+        self.app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'] = 3
+        login_throttle.init_app(self.app)
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            login_throttle.failed(login_throttle.keys(email, '10.0.0.9'))
+        with self.assertRaises(LoginThrottled):
+            login_throttle.check(login_throttle.keys('d@example.com',
+                                                     '10.0.0.9'))
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PASSWORD_HASH_WORKERS'] = 1
+        self.hasher = PasswordHasher(self.app)
+
+    def tearDown(self):
+        if self.hasher._pool is not None:
+            self.hasher._pool.shutdown()
+
+    def test_pool_hashes_and_verifies(self):
+        password_hash = self.hasher.hash('secret')
+        self.assertIsNotNone(self.hasher._pool)
+        self.assertTrue(self.hasher.verify(password_hash, 'secret'))
+        self.assertFalse(self.hasher.verify(password_hash, 'wrong'))
+        self.assertFalse(self.hasher.verify(None, 'secret'))
+
+    def test_hash_of_other_settings_needs_rehash(self):
+        password_hash = self.hasher.hash('secret')
+        self.assertFalse(self.hasher.needs_rehash(password_hash))
+        self.app.config['PASSWORD_HASH_ITERATIONS'] += 1
+        self.hasher.init_app(self.app)
+        self.assertTrue(self.hasher.needs_rehash(password_hash))
@@ -0,0 +1,25 @@
+import unittest
+
+from app.models import parse_price, MAX_PRICE_CENTS
+
+
+class ParsePriceTestCase(unittest.TestCase):
+    def test_prices(self):
+        self.assertEqual(parse_price('$7.50'), 750)
+        self.assertEqual(parse_price('$.99'), 99)
+        self.assertEqual(parse_price('15'), 1500)
+        self.assertEqual(parse_price('$1,000'), 100000)
+
+    def test_empty_or_not_a_number(self):
+        for price in (None, '', '  ', '$', 'abc', '1.2.3'):
+            self.assertIsNone(parse_price(price), price)
+
+    def test_not_finite(self):
+        for price in ('nan', 'NaN', 'snan', 'inf', '-inf', 'Infinity'):
+            self.assertIsNone(parse_price(price), price)
+
+    def test_too_large(self):
+        self.assertEqual(parse_price('21474836.47'), MAX_PRICE_CENTS)
+        for price in ('21474836.48', '21474836.475', '1e30', '-1e30',
+                      '1e999999999'):
+            self.assertIsNone(parse_price(price), price)
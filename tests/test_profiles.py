@@ -0,0 +1,90 @@
+import unittest
+
+from app import create_app, db
+from app.models import Role, User, Restaurant, MenuItem
+
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['USERS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        admin = User(email='admin@example.com', username='admin',
+                     password='secret', confirmed=True,
+                     role=Role.query.filter_by(name='Administrator').first())
+        users = [User(email='user%d@example.com' % i, username='user%d' % i,
+                      password='secret', confirmed=True) for i in range(3)]
+        restaurant = Restaurant(name='First')
+        db.session.add_all([admin, restaurant] + users)
+        db.session.commit()
+        self.admin_id, self.restaurant_id = admin.id, restaurant.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email):
+        self.client.post('/auth/login', data={'email': email,
+                                              'password': 'secret'})
+
+    def counters(self, user_id):
+        db.session.expire_all()
+        user = User.query.get(user_id)
+        return user.items_created, user.items_edited
+
+    def create_item(self, name):
+        self.client.post('/restaurant/%d/menu/new/' % self.restaurant_id,
+                         data={'menu_item_name': name,
+                               'menu_item_course': 'Main',
+                               'menu_item_price': '$4.00',
+                               'menu_item_description': ''})
+        return db.session.query(MenuItem.id).filter_by(name=name).scalar()
+
+    def test_profile_page(self):
+        response = self.client.get('/user/user0')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('0 menu items created', response.data.decode('utf-8'))
+        self.assertEqual(self.client.get('/user/nobody').status_code, 404)
+
+    def test_writes_are_counted(self):
+        self.login('admin@example.com')
+        item_id = self.create_item('Soup')
+        self.client.post('/restaurant/%d/menu/%d/edit/'
+                         % (self.restaurant_id, item_id),
+                         data={'menu_item_name': 'Stew'})
+        self.assertEqual(self.counters(self.admin_id), (1, 1))
+        response = self.client.get('/user/admin')
+        self.assertIn('1 menu items created', response.data.decode('utf-8'))
+
+    def test_anonymous_writes_are_not_counted(self):
+        self.assertIsNotNone(self.create_item('Soup'))
+        self.assertEqual(self.counters(self.admin_id), (0, 0))
+
+    def test_failed_edit_is_not_counted(self):
+        self.login('admin@example.com')
+        response = self.client.post('/restaurant/%d/menu/12345/edit/'
+                                    % self.restaurant_id,
+                                    data={'menu_item_name': 'Stew'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.counters(self.admin_id), (0, 0))
+
+    def test_users_page(self):
+        self.assertNotEqual(self.client.get('/users/').status_code, 200)
+        self.login('user0@example.com')
+        self.assertEqual(self.client.get('/users/').status_code, 403)
+        self.client.get('/auth/logout')
+        self.login('admin@example.com')
+        response = self.client.get('/users/')
+        self.assertEqual(response.status_code, 200)
+        body = response.data.decode('utf-8')
+        self.assertIn('>admin<', body)
+        self.assertIn('>user0<', body)
+        self.assertNotIn('>user1<', body)
+        ids = [user.id for user in User.query.order_by(User.id)]
+        response = self.client.get('/users/?after=%d' % ids[1])
+        self.assertIn('>user1<', response.data.decode('utf-8'))
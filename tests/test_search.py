@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from app import create_app, db, search_index
+from app.models import Role, Restaurant, MenuItem
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        restaurant = Restaurant(name='Harbour Grill')
+        db.session.add(restaurant)
+        db.session.flush()
+        for name, description in (('Tomato Soup', 'with basil'),
+                                  ('Fish Soup', 'catch of the day'),
+                                  ('Steak', 'grilled over charcoal')):
+            db.session.add(MenuItem(name=name, description=description,
+                                    course='Main', price='$5',
+                                    restaurant_id=restaurant.id))
+        db.session.commit()
+        search_index.rebuild()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, query):
+        response = self.client.get('/search/JSON?' + query)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_every_word_matches_a_prefix(self):
+        data = self.search('q=sou')
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(sorted(result['name'] for result in data['results']),
+                         ['Fish Soup', 'Tomato Soup'])
+        data = self.search('q=fish+sou')
+        self.assertEqual([result['name'] for result in data['results']],
+                         ['Fish Soup'])
+
+    def test_restaurant_name_matches(self):
+        data = self.search('q=harbour')
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['results'][0]['restaurant_name'],
+                         'Harbour Grill')
+
+    def test_pages(self):
+        first = self.search('q=harbour&per_page=2')
+        second = self.search('q=harbour&per_page=2&page=2')
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(len(second['results']), 1)
+        self.assertEqual(self.search('q=')['total'], 0)
+
+    def test_page_beyond_max_offset(self):
+        for page in ('99999999999999999999', '100000'):
+            response = self.client.get('/search/JSON?q=soup&page=' + page)
+            self.assertEqual(response.status_code, 400, page)
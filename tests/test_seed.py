@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.models import Role, Restaurant, MenuItem, MenuDocument
+from app.seed import bulk_load, read_data, synthesize
+
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def write(self, name, content):
+        path = os.path.join(self.data_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_bulk_load(self):
+        counts = bulk_load(synthesize(7, 3), chunk_size=4)
+        self.assertEqual((counts['restaurants'], counts['menu_items']),
+                         (7, 21))
+        self.assertEqual(Restaurant.query.count(), 7)
+        for restaurant in Restaurant.query:
+            self.assertEqual(MenuItem.query.filter_by(
+                restaurant_id=restaurant.id).count(), 3)
+        self.assertEqual(MenuDocument.query.count(), 7)
+        item = MenuItem.query.first()
+        self.assertIsNotNone(item.price_cents)
+        self.assertEqual(item.course_key, item.course.lower())
+
+    def test_load_after_existing_rows(self):
+        db.session.add(Restaurant(name='Existing'))
+        db.session.commit()
+        bulk_load(synthesize(2, 1))
+        self.assertEqual(Restaurant.query.count(), 3)
+        self.assertEqual(len({item.restaurant_id for item in MenuItem.query}),
+                         2)
+
+    def test_read_json(self):
+        path = self.write('menus.json', json.dumps({'restaurants': [
+            {'name': 'First', 'menu_items': [{'name': 'Soup',
+                                              'price': '$3.00'}]},
+            {'name': 'Second'}]}))
+        restaurants = list(read_data(path))
+        self.assertEqual([r['name'] for r in restaurants],
+                         ['First', 'Second'])
+        bulk_load(restaurants)
+        self.assertEqual(MenuItem.query.one().name, 'Soup')
+
+    def test_read_csv(self):
+        path = self.write('menus.csv',
+                          'restaurant,name,description,price,course\n'
+                          'First,Soup,,$3.00,Appetizer\n'
+                          'First,Cake,,$4.00,Dessert\n'
+                          'Second,,,,\n')
+        restaurants = list(read_data(path))
+        self.assertEqual([(r['name'], len(r['menu_items']))
+                          for r in restaurants], [('First', 2), ('Second', 0)])
+
+    def test_synthesize_is_deterministic(self):
+        self.assertEqual(list(synthesize(2, 2, seed=1)),
+                         list(synthesize(2, 2, seed=1)))
@@ -0,0 +1,35 @@
+import unittest
+
+from flask import Flask
+
+from app import create_app, db
+from app.serving import default_workers, enable_sqlite_wal
+from config import config
+
+
+class ServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.execute('PRAGMA journal_mode=DELETE')
+            db.session.remove()
+
+    def test_default_workers(self):
+        self.assertGreaterEqual(default_workers(), 3)
+
+    def test_sqlite_wal(self):
+        self.assertEqual(enable_sqlite_wal(self.app), 'wal')
+
+    def test_pool_settings_cleared_for_sqlite(self):
+        app = Flask(__name__)
+        app.config.from_object(config['production'])
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        config['production'].init_app(app)
+        self.assertIsNone(app.config['SQLALCHEMY_POOL_SIZE'])
+        app.config.from_object(config['production'])
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://db/menus'
+        config['production'].init_app(app)
+        self.assertEqual(app.config['SQLALCHEMY_POOL_SIZE'],
+                         config['production'].SQLALCHEMY_POOL_SIZE)
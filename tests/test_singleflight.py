@@ -0,0 +1,74 @@
+import threading
+import unittest
+
+from app.singleflight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+
+    def run_threads(self, count, target):
+        threads = [threading.Thread(target=target) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def wait_for_waiters(self, key, count):
+        # the leader holds the call until every other thread waits on it
+        while self.flight.stats()['waiters'].get(key, 0) < count:
+            threading.Event().wait(0.001)
+
+    def test_concurrent_calls_share_one_load(self):
+        release = threading.Event()
+        calls, results = [], []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return {'menu': 1}
+
+        threads = self.run_threads(
+            8, lambda: results.append(self.flight.do(('menu', 1), load)))
+        self.wait_for_waiters('menu:1', 7)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'menu': 1}] * 8)
+        self.assertEqual((self.flight.executions, self.flight.shared), (1, 7))
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+
+    def test_error_reaches_every_waiter_and_is_not_kept(self):
+        release = threading.Event()
+        errors = []
+
+        def load():
+            release.wait(5)
+            raise ValueError('database is locked')
+
+        def call():
+            try:
+                self.flight.do('menu', load)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = self.run_threads(4, call)
+        self.wait_for_waiters('menu', 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 4)
+        # the next call runs the loader again
+        self.assertEqual(self.flight.do('menu', lambda: 'loaded'), 'loaded')
+        self.assertEqual(self.flight.executions, 2)
+
+    def test_different_keys_do_not_wait(self):
+        self.assertEqual(self.flight.do(1, lambda: 'a'), 'a')
+        self.assertEqual(self.flight.do(2, lambda: 'b'), 'b')
+        self.assertEqual(self.flight.shared, 0)
+
+    def test_disabled(self):
+        self.flight.enabled = False
+        self.flight.do('menu', lambda: None)
+        self.assertEqual(self.flight.executions, 0)
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app
+from app.startup import bytecode_cache, precompile_templates
+
+
+class StartupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), 'jinja-cache')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+    def test_disabled_in_tests(self):
+        self.assertIsNone(bytecode_cache(self.app))
+        self.assertIsNone(self.app.jinja_env.bytecode_cache)
+
+    def test_cache_directory_is_created(self):
+        self.app.config['TEMPLATE_CACHE_DIR'] = self.cache_dir
+        self.assertIsNotNone(bytecode_cache(self.app))
+        self.assertTrue(os.path.isdir(self.cache_dir))
+
+    def test_precompile_templates(self):
+        self.app.config['TEMPLATE_CACHE_DIR'] = self.cache_dir
+        self.app.jinja_env.bytecode_cache = bytecode_cache(self.app)
+        names = [name for name, seconds in precompile_templates(self.app)]
+        for name in ('menu.html', 'auth/login.html', 'bootstrap/base.html'):
+            self.assertIn(name, names)
+        self.assertEqual(len(os.listdir(self.cache_dir)), len(names))
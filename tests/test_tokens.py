@@ -0,0 +1,79 @@
+import base64
+import json
+import unittest
+
+from app import create_app, db
+from app.models import Role, User
+
+
+class ApiTokenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.admin = User(
+            email='admin@example.com', username='admin', password='secret',
+            confirmed=True,
+            role=Role.query.filter_by(name='Administrator').first())
+        self.user = User(email='user@example.com', username='user',
+                         password='secret', confirmed=True)
+        db.session.add_all([self.admin, self.user])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, token):
+        return self.client.get(url, headers={
+            'Authorization': 'Bearer ' + token})
+
+    def test_issue_token_with_basic_auth(self):
+        credentials = base64.b64encode(b'admin@example.com:secret')
+        response = self.client.post('/auth/tokens', headers={
+            'Authorization': 'Basic ' + credentials.decode('ascii')})
+        self.assertEqual(response.status_code, 200)
+        token = json.loads(response.data.decode('utf-8'))['token']
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 200)
+
+    def test_wrong_password_gets_no_token(self):
+        credentials = base64.b64encode(b'admin@example.com:wrong')
+        response = self.client.post('/auth/tokens', headers={
+            'Authorization': 'Basic ' + credentials.decode('ascii')})
+        self.assertEqual(response.status_code, 401)
+
+    def test_valid_token_authorizes(self):
+        token = self.admin.generate_api_token()
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 200)
+
+    def test_expired_token(self):
+        token = self.admin.generate_api_token(expiration=-10)
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 401)
+
+    def test_revoked_token(self):
+        token = self.admin.generate_api_token()
+        response = self.client.delete('/auth/tokens', headers={
+            'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 401)
+
+    def test_tampered_signature(self):
+        header, payload, signature = \
+            self.admin.generate_api_token().split('.')
+        # the first character holds six bits of the signature
+        first = 'A' if signature[0] != 'A' else 'B'
+        token = '.'.join((header, payload, first + signature[1:]))
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 401)
+
+    def test_token_of_other_secret(self):
+        token = self.admin.generate_api_token()
+        self.app.config['SECRET_KEY'] = 'other'
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 401)
+
+    def test_user_token_is_forbidden_on_admin_routes(self):
+        token = self.user.generate_api_token()
+        self.assertEqual(self.get('/cache/JSON', token).status_code, 403)
@@ -0,0 +1,76 @@
+import unittest
+
+from app import create_app, db, user_cache
+from app.cache import LRUCache
+from app.models import Role, User
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user_cache.backend = LRUCache(maxsize=16, ttl=300)
+        user = User(email='user@example.com', username='user',
+                    password='secret', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+
+    def tearDown(self):
+        user_cache.init_app(self.app)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def load(self):
+        user = User.load_user(str(self.user_id))
+        # every request starts with a new session
+        db.session.remove()
+        return user
+
+    def test_cached_user_is_reused(self):
+        self.assertEqual(self.load().username, 'user')
+        user = User.load_user(str(self.user_id))
+        self.assertEqual(user_cache.backend.stats.hits, 1)
+        self.assertIn(user, db.session)
+        self.assertEqual(user.role.name, 'User')
+
+    def test_missing_user(self):
+        self.assertIsNone(User.load_user('12345'))
+        self.assertIsNone(User.load_user('12345'))
+
+    def test_update_invalidates(self):
+        self.load()
+        user = User.query.get(self.user_id)
+        user.name = 'Changed'
+        db.session.commit()
+        db.session.remove()
+        self.assertEqual(self.load().name, 'Changed')
+
+    def test_rollback_keeps_cached_user(self):
+        self.load()
+        user = User.query.get(self.user_id)
+        user.name = 'Changed'
+        db.session.flush()
+        db.session.rollback()
+        db.session.remove()
+        self.assertIsNone(self.load().name)
+        self.assertEqual(user_cache.backend.stats.hits, 1)
+
+    def test_activity_counters_invalidate(self):
+        self.assertEqual(self.load().items_created, 0)
+        User.count_activity(self.user_id, created=2)
+        db.session.commit()
+        self.assertEqual(self.load().items_created, 2)
+
+    def test_role_change_clears(self):
+        self.load()
+        role = Role.query.filter_by(name='User').first()
+        role.permissions = 0
+        db.session.commit()
+        db.session.remove()
+        self.assertEqual(self.load().role.permissions, 0)
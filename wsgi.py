@@ -0,0 +1,6 @@
+import os
+
+from app import create_app
+
+# entry point for wsgi servers, e.g. gunicorn wsgi:app
+app = create_app(os.getenv('MENU_CONFIG') or 'production')